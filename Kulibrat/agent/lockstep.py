@@ -0,0 +1,174 @@
+"""
+Lockstep play of many games in a single process
+
+Every round the searches of all the running games descend their tree to a leaf,
+then all the leaves are evaluated with a single call of the evaluator and the
+results are backpropagated. The evaluators play the rollouts with the random
+stream of each tree, so the games are identical to the ones of run_games with the
+same seeds: rollout_evaluator calls MCTS.rollout, compact_evaluator calls
+Kulibrat.random_playout and refuses the trees with another rollout policy.
+With rollouts the games are about as fast as in run_games, lockstep pays off with
+an evaluator scoring the whole batch at once (i.e. a value function).
+Agents other than MCTSAgent choose their moves directly
+"""
+from __future__ import annotations
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from Kulibrat.agent.mcts import MCTS, LeafSteps, MCTSAgent
+from Kulibrat.game.game import Action, Kulibrat, Player
+from Kulibrat.game.record import GameRecord, GameRecordBuffer, GameRecordWriter
+from Kulibrat.tournament.runner import GameJob, describe, game_rngs
+
+# (leaf, list collecting the rollout moves or None)
+LeafRequest = Tuple[MCTS, Optional[List[Tuple[Player, int]]]]
+# Returns the rollout result (final scores) of every leaf
+Evaluator = Callable[[List[LeafRequest]], List[Dict[Player, int]]]
+
+
+def rollout_evaluator(requests: List[LeafRequest]) -> List[Dict[Player, int]]:
+    return [leaf.rollout(moves) for leaf, moves in requests]
+
+
+def compact_evaluator(requests: List[LeafRequest]) -> List[Dict[Player, int]]:
+    """
+    Plays the rollouts of the batch with Kulibrat.random_playout. It reproduces only
+    the uniform rollout policy: raises ValueError, before playing any rollout, if a
+    tree overrides rollout_policy (see rollout_evaluator)
+    """
+    for leaf, _ in requests:
+        if not leaf.uniform_rollouts():
+            raise ValueError(
+                f"{type(leaf).__name__} overrides rollout_policy, use rollout_evaluator"
+            )
+    return [
+        leaf.state.random_playout(leaf.rng, moves)
+        if leaf.proven is Player.EMPTY
+        # Exact result of a proven node
+        else leaf.rollout(moves)
+        for leaf, moves in requests
+    ]
+
+
+def _immediate(action: Action) -> LeafSteps:
+    # A move chosen without searching, as a generator yielding nothing
+    return action
+    yield
+
+
+class LockstepGame:
+    """
+    A game played one search step at a time, following the same protocol of
+    Controller.play
+    """
+
+    def __init__(self, job: GameJob, record: bool = False):
+        black, red, max_score, seed = job
+        self.game = Kulibrat(max_score=max_score)
+        black_rng, red_rng = game_rngs(seed)
+        self.agents = {
+            Player.BLACK: black(self.game, Player.BLACK, rng=black_rng),
+            Player.RED: red(self.game, Player.RED, rng=red_rng),
+        }
+        self.recorder = GameRecordBuffer() if record else None
+        if self.recorder is not None:
+            self.recorder.begin_game(
+                max_score,
+                describe(black, self.agents[Player.BLACK]),
+                describe(red, self.agents[Player.RED]),
+            )
+        self.prev_turn = Player.EMPTY
+        self.prev_actions: List[Action] = []
+        self.steps: Optional[LeafSteps] = None
+
+    @property
+    def winner(self) -> Player:
+        return self.game.winner
+
+    @property
+    def record(self) -> Optional[GameRecord]:
+        return self.recorder.game if self.recorder is not None else None
+
+    def _move_steps(self) -> LeafSteps:
+        turn = self.game.turn
+        if turn != self.prev_turn:
+            previous = self.prev_actions
+            self.prev_actions = []
+        else:
+            previous = []
+        agent = self.agents[turn]
+        if isinstance(agent, MCTSAgent):
+            return agent.move_steps(self.game.allowed_actions, previous)
+        return _immediate(agent.choose_move(self.game.allowed_actions, previous))
+
+    def _play(self, action: Action):
+        self.prev_actions.append(action)
+        self.prev_turn = self.game.turn
+        if self.recorder is not None:
+            self.recorder.record(action)
+        self.game.execute_action(action)
+
+    def step(self, result: Optional[Dict[Player, int]] = None) -> Optional[LeafRequest]:
+        """
+        Sends the result of the last request to the search and plays until a leaf
+        has to be evaluated. Returns its request, None when the game is over
+        """
+        while self.game.winner == Player.EMPTY:
+            if self.steps is None:
+                self.steps = self._move_steps()
+            try:
+                return self.steps.send(result)
+            except StopIteration as stop:
+                self.steps = None
+                result = None
+                self._play(stop.value)
+        if self.recorder is not None:
+            self.recorder.end_game()
+        return None
+
+
+def run_lockstep(
+    jobs: Iterable[GameJob],
+    concurrency: int = 64,
+    evaluator: Evaluator = compact_evaluator,
+    writer: Optional[GameRecordWriter] = None,
+) -> Iterator[Player]:
+    """
+    Plays up to concurrency games of the jobs at the same time in lockstep and
+    yields the winners in the same order of the jobs, as run_games.
+    If a writer is provided the games are appended to its archive in that order
+    """
+    jobs = enumerate(jobs)
+    running: List[Tuple[int, LockstepGame, LeafRequest]] = []
+    # Winner and record of the games finished before the previous ones
+    finished: Dict[int, Tuple[Player, Optional[GameRecord]]] = {}
+    next_result = 0
+    exhausted = False
+    while running or not exhausted:
+        while not exhausted and len(running) < concurrency:
+            item = next(jobs, None)
+            if item is None:
+                exhausted = True
+                break
+            i, job = item
+            game = LockstepGame(job, record=writer is not None)
+            request = game.step()
+            if request is None:
+                finished[i] = (game.winner, game.record)
+            else:
+                running.append((i, game, request))
+        if running:
+            results = evaluator([request for _, _, request in running])
+            still_running = []
+            for (i, game, _), result in zip(running, results):
+                request = game.step(result)
+                if request is None:
+                    finished[i] = (game.winner, game.record)
+                else:
+                    still_running.append((i, game, request))
+            running = still_running
+        while next_result in finished:
+            winner, record = finished.pop(next_result)
+            if writer is not None:
+                writer.write_game(record)
+            yield winner
+            next_result += 1
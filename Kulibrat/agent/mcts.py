@@ -1,11 +1,35 @@
 from __future__ import annotations
-from typing import List, Dict
+from typing import Callable, Dict, Generator, Iterator, List, Optional, Set, Tuple
 from Kulibrat.game.game import Action, Kulibrat, Player
 from Kulibrat.game.agent import Agent
+from Kulibrat.agent.mcts_checkpoint import TreeCheckpoint, decode_proven, save_tree
 import math
 import random
 
 
+def linear_score(score: int) -> float:
+    """
+    Reward equal to the score
+    """
+    return score
+
+
+class PowerScore:
+    """
+    Reward equal to base ** score. Unlike a lambda it can be pickled, so agents
+    using it can be built inside a process pool
+    """
+
+    def __init__(self, base: float = 2):
+        self.base = base
+
+    def __call__(self, score: int) -> float:
+        return self.base ** score
+
+    def __repr__(self):
+        return f"PowerScore({self.base})"
+
+
 class MCTSAgent(Agent):
     """
     An agent that decides his next move building a Monte Carlo Search Tree (MCST)
@@ -19,6 +43,16 @@ class MCTSAgent(Agent):
         max_sim=15,
         score_f=lambda x: x,
         score_depth=100000,
+        rng: Optional[random.Random] = None,
+        solver=False,
+        rave=False,
+        rave_k=100,
+        root_policy="uct",
+        gumbel_k=0,
+        final_move="ucbt",
+        checkpoint: Optional[str] = None,
+        on_search_info: Optional[Callable[[SearchInfo], Optional[bool]]] = None,
+        report_every=1,
     ):
         """
         game : Kulibrat
@@ -52,8 +86,69 @@ class MCTSAgent(Agent):
         3 + 2 = 5 points, or when max_score is reached). A lower values increases
         time performances of the search (in game with big max_scores) but if it
         is too low could decrease the quality of the AI
+
+        rng : random.Random
+        ---
+        The random stream used for shuffling the expansions and for the rollouts.
+        Passing a seeded stream makes the search reproducible. If None a new stream
+        seeded from the OS entropy source is used
+
+        solver : bool
+        ---
+        Enables the MCTS-Solver: nodes whose outcome is proven (finished games and
+        positions where the player to move can force the result) are marked with
+        their winner, proven losing moves are not explored anymore and a proven
+        winning move is played without simulating
+
+        rave : bool
+        ---
+        Enables RAVE (all moves as first): every node also collects the results of
+        the simulations in which its player made a move later in the game, and UCBT
+        blends them with the results of the move itself. It makes the few visits of
+        a small max_sim more informative
+
+        rave_k : float
+        ---
+        RAVE equivalence parameter: the number of visits of a move after which its
+        own results and the all moves as first ones weight the same
+
+        root_policy : str
+        ---
+        How the simulations are distributed among the moves of the root:
+        "uct" selects them with UCBT, "sequential_halving" gives the same budget to
+        every move, then repeatedly halves the moves keeping the best ones (better
+        with a small max_sim). Below the root UCBT is always used
+
+        gumbel_k : int
+        ---
+        With sequential halving, if > 0 only gumbel_k moves sampled with the
+        Gumbel-top-k trick are considered, and Gumbel noise is added to their values
+
+        final_move : str
+        ---
+        How the move is chosen after the uct simulations: "ucbt" (exploration
+        term included), "value" (best average reward) or "visits" (most visited)
+
+        checkpoint : str
+        ---
+        Path of a search tree saved with save_tree whose root is the current state
+        of the game. The search starts from its statistics, nodes are read from
+        the file only when they are reached
+
+        on_search_info : function
+        ---
+        If provided the moves are chosen with the anytime search (see MCTS.search):
+        the function receives a SearchInfo every report_every simulations and can
+        return True to stop the search and play the current best move.
+        The anytime search uses UCT at the root and plays the most visited move,
+        so root_policy and final_move must keep their default values
         """
+        if on_search_info is not None and (root_policy, final_move) != ("uct", "ucbt"):
+            raise ValueError(
+                "on_search_info does not support root_policy and final_move"
+            )
         super().__init__(game, player)
+        self.rng = rng if rng is not None else random.Random()
         self.tree_root = MCTS(
             self.player,
             state=game.copy_state(),
@@ -61,15 +156,42 @@ class MCTSAgent(Agent):
             max_sim=max_sim,
             score_f=score_f,
             score_depth=score_depth,
+            rng=self.rng,
+            solver=solver,
+            rave=rave,
+            rave_k=rave_k,
+            root_policy=root_policy,
+            gumbel_k=gumbel_k,
+            final_move=final_move,
         )
+        if checkpoint is not None:
+            tree = TreeCheckpoint(checkpoint)
+            if not tree.matches(self.tree_root.state):
+                tree.close()
+                raise ValueError(f"The root of {checkpoint} is not the game state")
+            self.tree_root.attach_checkpoint(tree, 0)
         self.c = c
         self.max_sim = max_sim
         self.score_f = score_f
         self.score_depth = score_depth
+        self.solver = solver
+        self.rave = rave
+        self.rave_k = rave_k
+        self.root_policy = root_policy
+        self.gumbel_k = gumbel_k
+        self.final_move = final_move
+        self.on_search_info = on_search_info
+        self.report_every = report_every
 
     def __str__(self):
         return f"Montecarlo Tree Search Agent c = {self.c}"
 
+    def save_tree(self, path: str) -> int:
+        """
+        Saves the current search tree (see mcts_checkpoint), returns the number of nodes
+        """
+        return save_tree(self.tree_root, path)
+
     def advance_tree_root(self, action: Action) -> MCTS:
         """
         Moves the tree root to the child indicated from the action
@@ -91,11 +213,76 @@ class MCTSAgent(Agent):
             self.advance_tree_root(action)
         # Decide here what move perform and assign it to chosen_action
 
-        chosen_action = self.tree_root.simulation()
+        if self.on_search_info is None:
+            chosen_action = self.tree_root.simulation()
+        else:
+            for info in self.tree_root.search(self.report_every):
+                if self.on_search_info(info):
+                    break
+            chosen_action = info.best_action
         # Align tree on the choice performed
         self.advance_tree_root(chosen_action)
         return chosen_action
 
+    def move_steps(
+        self, actions: List[Action], previous_actions: List[Action] = []
+    ) -> LeafSteps:
+        """
+        Same as choose_move, as a generator yielding the leaves to evaluate
+        (see MCTS.simulation_steps). The anytime search is not split in steps
+        """
+        if self.on_search_info is not None:
+            return self.choose_move(actions, previous_actions)
+        for action in previous_actions:
+            self.advance_tree_root(action)
+        chosen_action = yield from self.tree_root.simulation_steps()
+        self.advance_tree_root(chosen_action)
+        return chosen_action
+
+
+class SearchInfo:
+    """
+    Snapshot of an anytime search (see MCTS.search)
+
+    best_action is the most visited move, value its average reward for the player
+    of the tree, visits the visit count of every expanded move, pv the principal
+    variation (most visited line), simulations the simulations done so far
+    """
+
+    def __init__(
+        self,
+        best_action: Action,
+        value: Optional[float],
+        visits: Dict[Action, int],
+        pv: List[Action],
+        simulations: int,
+        finished: bool,
+    ):
+        self.best_action = best_action
+        self.value = value
+        self.visits = visits
+        self.pv = pv
+        self.simulations = simulations
+        self.finished = finished
+
+    def __repr__(self):
+        value = f"{self.value:.3f}" if self.value is not None else "-"
+        return (
+            f"{self.simulations} sims, best {self.best_action} value {value}, "
+            f"pv {' / '.join(str(action) for action in self.pv)}"
+        )
+
+
+ROOT_POLICIES = ("uct", "sequential_halving")
+FINAL_MOVES = ("ucbt", "value", "visits")
+
+# A search split in steps: it yields the leaves to evaluate with the list collecting
+# their rollout moves (None without RAVE), receives the rollout results and returns
+# the chosen action
+LeafSteps = Generator[
+    Tuple["MCTS", Optional[List[Tuple[Player, int]]]], Dict[Player, int], Action
+]
+
 
 class MCTS:
     """
@@ -115,7 +302,18 @@ class MCTS:
         parent=None,
         parent_action=None,
         score_depth=100000,
+        rng: Optional[random.Random] = None,
+        solver=False,
+        rave=False,
+        rave_k=100,
+        root_policy="uct",
+        gumbel_k=0,
+        final_move="ucbt",
     ):
+        if root_policy not in ROOT_POLICIES:
+            raise ValueError(f"Unknown root policy {root_policy}")
+        if final_move not in FINAL_MOVES:
+            raise ValueError(f"Unknown final move rule {final_move}")
         self.state = state
         self.player = player
         self.parent = parent
@@ -124,23 +322,89 @@ class MCTS:
             Action, MCTS
         ] = {}  # key = Action that leads to that state, value = state
         self.number_of_visits: int = 0
+        self.log_visits = 0.0  # log(number_of_visits) cached for UCBT
         self.results = {Player.BLACK: 0.0, Player.RED: 0.0}
-        self.untried_actions = self.state.get_possible_actions()
-        random.shuffle(self.untried_actions)
+        # Statistics of the children stored in parallel lists (same order of
+        # child_actions) and updated during backpropagation, so that UCBT does a
+        # single pass over them without visiting the child nodes
+        self.child_actions: List[Action] = []
+        self.child_nodes: List[MCTS] = []
+        self.child_visits: List[int] = []
+        self.child_log_visits: List[float] = []
+        self.child_q: List[float] = []
+        self.child_codes: List[int] = []  # Integer encoding of child_actions
+        self.index_in_parent = -1
+        # The whole tree shares the same random stream
+        self.rng = rng if rng is not None else random.Random()
+        # Copy, the list of the state is shared
+        self.untried_actions = list(self.state.allowed_actions)
+        self.rng.shuffle(self.untried_actions)
         self.c = c
         self.max_sim = max_sim
         self.score_f = score_f
         self.score_depth = score_depth
+        self.solver = solver
+        # MCTS-Solver: the winner of the game when it is known (proven) from this
+        # node, Player.EMPTY otherwise
+        self.proven = state.winner if solver else Player.EMPTY
+        self.rave = rave
+        self.rave_k = rave_k
+        # RAVE: move code -> [visits, q] of the simulations through this node in
+        # which the player to move here played that move later
+        self.amaf: Dict[int, List[float]] = {}
+        # Options of simulation(), kept on every node since any node can become root
+        self.root_policy = root_policy
+        self.gumbel_k = gumbel_k
+        self.final_move = final_move
+        # Checkpoint node backing this node, until its children are restored
+        self.checkpoint: Optional[TreeCheckpoint] = None
+        self.checkpoint_index = -1
+
+    def attach_checkpoint(self, checkpoint: TreeCheckpoint, index: int) -> None:
+        """
+        Loads the statistics of a checkpoint node, its children are restored
+        lazily (see restore)
+        """
+        _, _, _, proven, visits, black, red = checkpoint.node(index)
+        self.number_of_visits = visits
+        self.log_visits = math.log(visits) if visits > 0 else 0.0
+        self.results = {Player.BLACK: black, Player.RED: red}
+        if self.solver and decode_proven(proven) is not Player.EMPTY:
+            # A tree saved without the solver stores no proofs, keep the winner
+            # of finished games set by __init__
+            self.proven = decode_proven(proven)
+        self.checkpoint = checkpoint
+        self.checkpoint_index = index
+
+    def restore(self) -> None:
+        """
+        Expands the children saved in the checkpoint of this node, if any
+        """
+        if self.checkpoint is None:
+            return
+        checkpoint = self.checkpoint
+        self.checkpoint = None
+        for code, index in checkpoint.children(self.checkpoint_index).items():
+            action = self.state.decode_action(code)
+            if action in self.untried_actions:
+                self.untried_actions.remove(action)
+            child = self[action]
+            child.attach_checkpoint(checkpoint, index)
+            i = child.index_in_parent
+            self.child_visits[i] = child.number_of_visits
+            self.child_log_visits[i] = child.log_visits
+            self.child_q[i] = child.q()
 
     def __getitem__(self, action: Action) -> MCTS:
         """
         Returns the child with the specified action.
         Generates the child if it is not yet present
         """
+        self.restore()
         if action in self.children:
             return self.children[action]
         else:
-            if action in self.state.get_possible_actions():
+            if action in self.state.allowed_actions:
                 e = self.expand(action)
                 return e
             else:
@@ -152,6 +416,7 @@ class MCTS:
         return wins - loses
 
     def expand(self, action: Action) -> MCTS:
+        self.restore()
         next_state = self.state.copy_state()
         next_state.execute_action(action)
         child_node = MCTS(
@@ -163,8 +428,22 @@ class MCTS:
             parent=self,
             parent_action=action,
             score_depth=self.score_depth,
+            rng=self.rng,
+            solver=self.solver,
+            rave=self.rave,
+            rave_k=self.rave_k,
+            root_policy=self.root_policy,
+            gumbel_k=self.gumbel_k,
+            final_move=self.final_move,
         )
         self.children[action] = child_node
+        child_node.index_in_parent = len(self.child_actions)
+        self.child_actions.append(action)
+        self.child_nodes.append(child_node)
+        self.child_visits.append(0)
+        self.child_log_visits.append(0.0)
+        self.child_q.append(0.0)
+        self.child_codes.append(action.encode())
         return child_node
 
     def is_terminal_node(self, max_score) -> bool:
@@ -175,34 +454,119 @@ class MCTS:
             return True
         return self.state.check_game_over()
 
-    def rollout(self) -> Dict[Player, int]:
+    def rollout(
+        self, moves: Optional[List[Tuple[Player, int]]] = None
+    ) -> Dict[Player, int]:
+        """
+        Plays the game till the end with random moves and returns the final score.
+        The moves played are appended to moves (as player, move code) if provided.
+        The uniform rollout policy is played by Kulibrat.random_playout, with the
+        same moves of executing the actions
+        """
+        if self.proven is not Player.EMPTY:
+            # Exact outcome, the winner reaches the max score
+            score = dict(self.state.score)
+            score[self.proven] = self.state.max_score
+            return score
+        if self.uniform_rollouts():
+            return self.state.random_playout(self.rng, moves)
         current_rollout_state = self.state.copy_state()
         while not current_rollout_state.check_game_over():
-            possible_moves = current_rollout_state.get_possible_actions()
+            # Already computed by post_turn
+            possible_moves = current_rollout_state.allowed_actions
             action = self.rollout_policy(possible_moves)
+            if moves is not None:
+                moves.append((current_rollout_state.turn, action.encode()))
             current_rollout_state.execute_action(action)
         return current_rollout_state.score
 
-    def backpropagate(self, result: Dict[Player, int]) -> None:
-        self.number_of_visits += 1
-        for player, score in result.items():
-            self.results[player] += self.score_f(score)
-        if self.parent is not None:
-            self.parent.backpropagate(result)
+    def backpropagate(
+        self,
+        result: Dict[Player, int],
+        moves: Optional[List[Tuple[Player, int]]] = None,
+    ) -> None:
+        """
+        Updates the statistics of the node and of its ancestors.
+        With RAVE, moves are the rollout moves (see rollout)
+        """
+        rewards = {player: self.score_f(score) for player, score in result.items()}
+        q = rewards[self.player] - rewards[self.player.opponent()]
+        # RAVE: codes of the moves played by each player after the current node
+        played: Dict[Player, Set[int]] = {Player.BLACK: set(), Player.RED: set()}
+        if moves is not None:
+            for player, code in moves:
+                played[player].add(code)
+        node = self
+        while node is not None:
+            if node.rave:
+                amaf = node.amaf
+                for code in played[node.state.turn]:
+                    stats = amaf.get(code)
+                    if stats is None:
+                        amaf[code] = [1, q]
+                    else:
+                        stats[0] += 1
+                        stats[1] += q
+            node.number_of_visits += 1
+            node.log_visits = math.log(node.number_of_visits)
+            for player, reward in rewards.items():
+                node.results[player] += reward
+            parent = node.parent
+            if parent is not None:
+                i = node.index_in_parent
+                parent.child_visits[i] = node.number_of_visits
+                parent.child_log_visits[i] = node.log_visits
+                parent.child_q[i] += q
+                if node.proven is not Player.EMPTY:
+                    parent.update_proof()
+                if node.rave:
+                    played[parent.state.turn].add(parent.child_codes[i])
+            node = parent
+
+    def update_proof(self) -> None:
+        """
+        MCTS-Solver minimax step: the player to move wins if one of the children is
+        a proven win for him, loses if all the moves are expanded and proven losses
+        """
+        if self.proven is not Player.EMPTY:
+            return
+        mover = self.state.turn
+        if any(child.proven is mover for child in self.child_nodes):
+            self.proven = mover
+        elif self.is_fully_expanded() and all(
+            child.proven is mover.opponent() for child in self.child_nodes
+        ):
+            self.proven = mover.opponent()
 
     def is_fully_expanded(self) -> bool:
         return len(self.untried_actions) == 0
 
     def rollout_policy(self, possible_actions: List[Action]) -> Action:
-        return random.choice(possible_actions)
+        return self.rng.choice(possible_actions)
+
+    def uniform_rollouts(self) -> bool:
+        """
+        True if rollout_policy is not overridden
+        """
+        return type(self).rollout_policy is MCTS.rollout_policy
 
-    def tree_policy(self) -> MCTS:
+    def tree_policy(self, max_score: Optional[int] = None) -> MCTS:
+        """
+        Descends the tree with UCBT until a node to expand or a terminal node.
+        max_score is the score that ends the descent, by default score_depth
+        points more than the best score of this node
+        """
         current_node = self
-        max_score = (
-            max(self.state.score[Player.BLACK], self.state.score[Player.RED])
-            + self.score_depth
-        )
-        while not current_node.is_terminal_node(max_score):
+        if max_score is None:
+            max_score = (
+                max(self.state.score[Player.BLACK], self.state.score[Player.RED])
+                + self.score_depth
+            )
+        while (
+            not current_node.is_terminal_node(max_score)
+            and current_node.proven is Player.EMPTY
+        ):
+            current_node.restore()
             if not current_node.is_fully_expanded():
                 action = current_node.untried_actions.pop()
                 return current_node[action]
@@ -211,18 +575,276 @@ class MCTS:
         return current_node
 
     def simulation(self) -> Action:
+        if self.root_policy == "sequential_halving":
+            return self.sequential_halving()
         for _ in range(self.max_sim):
-            v = self.tree_policy()
-            reward = v.rollout()
-            v.backpropagate(reward)
-        return self.UCBT()
+            if self.proven is not Player.EMPTY:
+                # The outcome is known, UCBT returns the winning move if any
+                break
+            self.simulate_once()
+        return self.final_action()
+
+    def simulation_steps(self) -> LeafSteps:
+        """
+        Same as simulation, as a generator: every leaf to evaluate is yielded as
+        (leaf, moves) and its rollout result (see rollout) is sent back, so that the
+        leaves of many trees can be evaluated together (see Kulibrat.agent.lockstep).
+        With the same random stream the search is identical to simulation.
+        Sequential halving is not split in steps
+        """
+        if self.root_policy == "sequential_halving":
+            return self.sequential_halving()
+        for _ in range(self.max_sim):
+            if self.proven is not Player.EMPTY:
+                break
+            leaf = self.tree_policy()
+            moves = [] if self.rave else None
+            result = yield leaf, moves
+            leaf.backpropagate(result, moves)
+        return self.final_action()
+
+    def search(
+        self, report_every: int = 1, max_sim: Optional[int] = None
+    ) -> Iterator[SearchInfo]:
+        """
+        Anytime search: runs up to max_sim (default self.max_sim) UCT simulations
+        and yields a SearchInfo every report_every simulations. The caller can stop
+        iterating at any moment and play the best move of the last SearchInfo.
+        The search ends early when the most visited move can no longer be overtaken
+        in the remaining simulations, or when the outcome is proven by the solver.
+        The last SearchInfo has finished set.
+        Raises ValueError if report_every < 1
+        """
+        if report_every < 1:
+            raise ValueError("report_every must be at least 1")
+        budget = self.max_sim if max_sim is None else max_sim
+        done = 0
+        while True:
+            finished = (
+                done >= budget
+                or self.proven is not Player.EMPTY
+                or self._leader_margin() > budget - done
+            )
+            if finished or (done > 0 and done % report_every == 0):
+                yield self.search_info(done, finished)
+            if finished:
+                return
+            self.simulate_once()
+            done += 1
+
+    def _leader_margin(self) -> int:
+        """
+        Visits of the most visited child minus visits of the second one
+        """
+        if len(self.child_visits) < 2 or self.untried_actions:
+            return 0
+        first, second = sorted(self.child_visits, reverse=True)[:2]
+        return first - second
+
+    def best_child_index(self) -> int:
+        """
+        Index of the most visited child (best value on ties), -1 if none is visited
+        """
+        best = -1
+        for i, visits in enumerate(self.child_visits):
+            if visits == 0:
+                continue
+            if (
+                best < 0
+                or visits > self.child_visits[best]
+                or (
+                    visits == self.child_visits[best]
+                    and self.child_q[i] > self.child_q[best]
+                )
+            ):
+                best = i
+        return best
+
+    def search_info(self, simulations: int = 0, finished: bool = False) -> SearchInfo:
+        self.restore()
+        best = self.best_child_index()
+        if self.solver and self.proven is self.state.turn or best < 0:
+            # Proven winning move, or nothing visited yet
+            best_action = self.UCBT()
+        else:
+            best_action = self.child_actions[best]
+        # Read only: an untried best action is not expanded
+        child = self.children.get(best_action)
+        value = None
+        pv = [best_action]
+        if child is not None and child.number_of_visits:
+            value = child.q() / child.number_of_visits
+        node = child
+        while node is not None:
+            i = node.best_child_index()
+            if i < 0:
+                break
+            pv.append(node.child_actions[i])
+            node = node.child_nodes[i]
+        return SearchInfo(
+            best_action,
+            value,
+            dict(zip(self.child_actions, self.child_visits)),
+            pv,
+            simulations,
+            finished,
+        )
+
+    def simulate_once(self, max_score: Optional[int] = None) -> None:
+        """
+        One iteration of the search: selection and expansion, rollout and
+        backpropagation (up to the root of the whole tree)
+        """
+        v = self.tree_policy(max_score)
+        moves = [] if self.rave else None
+        reward = v.rollout(moves)
+        v.backpropagate(reward, moves)
+
+    def final_action(self) -> Action:
+        """
+        The move to play after the search, according to final_move
+        """
+        self.restore()
+        visited = [i for i, visits in enumerate(self.child_visits) if visits > 0]
+        if self.final_move == "ucbt" or not visited or self.proven is self.state.turn:
+            return self.UCBT()
+        if self.final_move == "visits":
+            best = max(
+                visited,
+                key=lambda i: (
+                    self.child_visits[i],
+                    self.child_q[i] / self.child_visits[i],
+                ),
+            )
+        else:
+            best = max(visited, key=lambda i: self.child_q[i] / self.child_visits[i])
+        return self.child_actions[best]
+
+    def sequential_halving(self) -> Action:
+        """
+        Sequential halving at the root: the max_sim simulations are split in
+        log2(moves) rounds, in every round each remaining move gets the same share
+        and the worst half of the moves is discarded.
+        With gumbel_k > 0 the candidate moves are sampled with Gumbel-top-k and
+        ranked by gumbel + sigma(value) (Danihelka et al., Policy improvement by
+        planning with Gumbel)
+        """
+        self.restore()
+        if self.proven is not Player.EMPTY:
+            return self.UCBT()
+        while self.untried_actions:
+            self.expand(self.untried_actions.pop())
+        candidates = list(range(len(self.child_actions)))
+        gumbel = [0.0] * len(candidates)
+        if self.gumbel_k > 0:
+            gumbel = [-math.log(-math.log(1 - self.rng.random())) for _ in candidates]
+            candidates.sort(key=lambda i: -gumbel[i])
+            candidates = candidates[: self.gumbel_k]
+        max_score = (
+            max(self.state.score[Player.BLACK], self.state.score[Player.RED])
+            + self.score_depth
+        )
+        rounds = max(1, math.ceil(math.log2(len(candidates))))
+        remaining = self.max_sim
+        while len(candidates) > 1:
+            # Every round gets the same share of the remaining simulations, the
+            # last one all of them, split evenly (the best moves get the rest)
+            budget = remaining // rounds if rounds > 1 else remaining
+            remaining -= budget
+            rounds -= 1
+            per_action, extra = divmod(budget, len(candidates))
+            for rank, i in enumerate(candidates):
+                child = self.child_nodes[i]
+                for _ in range(per_action + (rank < extra)):
+                    if child.proven is not Player.EMPTY:
+                        # Exact result, no need to descend
+                        child.backpropagate(child.rollout())
+                    else:
+                        child.simulate_once(max_score)
+                if self.proven is self.state.turn:
+                    # A winning move has been proven by the solver
+                    return self.UCBT()
+            score = self._halving_scores(candidates, gumbel)
+            candidates.sort(key=lambda i: score[i], reverse=True)
+            candidates = candidates[: math.ceil(len(candidates) / 2)]
+        return self.child_actions[candidates[0]]
+
+    def _halving_scores(
+        self, candidates: List[int], gumbel: List[float]
+    ) -> Dict[int, Tuple[int, float]]:
+        """
+        Ranking keys of the candidates (higher is better): proven losses for the
+        player to move come last, then the moves not simulated yet (a share smaller
+        than the candidates leaves some of them out), then the others by value
+        """
+        visited = [i for i in candidates if self.child_visits[i]]
+        values = {i: self.child_q[i] / self.child_visits[i] for i in visited}
+        if self.gumbel_k > 0 and visited:
+            # sigma(q) = (c_visit + max visits) * c_scale * q with q normalized
+            # in [0, 1], c_visit = 50 and c_scale = 0.1 as in the paper
+            low = min(values.values())
+            high = max(values.values())
+            width = high - low if high > low else 1.0
+            scale = (50 + max(self.child_visits[i] for i in visited)) * 0.1
+            values = {i: gumbel[i] + scale * (values[i] - low) / width for i in visited}
+        loser = self.state.turn.opponent()
+        keys = {}
+        for i in candidates:
+            if self.solver and self.child_nodes[i].proven is loser:
+                keys[i] = (0, 0.0)
+            elif i not in values:
+                # Unvisited moves keep the Gumbel order among themselves
+                keys[i] = (1, gumbel[i])
+            else:
+                keys[i] = (2, values[i])
+        return keys
 
     def UCBT(self) -> Action:
-        choices_weights = {
-            action: (child.q() / child.number_of_visits)
-            + self.c
-            * math.sqrt((2 * math.log(self.number_of_visits / child.number_of_visits)))
-            for action, child in self.children.items()
-            if child.number_of_visits > 0
-        }
-        return max(choices_weights.keys(), key=lambda v: choices_weights[v])
+        """
+        Returns the action of the child with the highest upper confidence bound
+        q / n + c * sqrt(2 * log(N / n)). Unvisited children are chosen first,
+        if no child has been expanded yet an untried action is returned.
+        With the solver a proven winning move for the player to move is returned
+        immediately and proven losing moves are skipped (unless all are losing).
+        With RAVE q / n is replaced by (1 - beta) * q / n + beta * q_amaf / n_amaf
+        where beta = sqrt(rave_k / (3 * n + rave_k))
+        """
+        self.restore()
+        if not self.child_actions:
+            if self.untried_actions:
+                return self.untried_actions[-1]
+            raise ValueError("No action permitted in this state")
+        loser = Player.EMPTY
+        if self.solver:
+            mover = self.state.turn
+            for i, child in enumerate(self.child_nodes):
+                if child.proven is mover:
+                    return self.child_actions[i]
+            if self.proven is Player.EMPTY:
+                loser = mover.opponent()
+        log_n = self.log_visits
+        c = self.c
+        child_q = self.child_q
+        child_log_visits = self.child_log_visits
+        child_nodes = self.child_nodes
+        best_i = 0
+        best_weight = -math.inf
+        for i, visits in enumerate(self.child_visits):
+            if loser is not Player.EMPTY and child_nodes[i].proven is loser:
+                continue
+            if visits == 0:
+                return self.child_actions[i]
+            value = child_q[i] / visits
+            if self.rave:
+                stats = self.amaf.get(self.child_codes[i])
+                if stats is not None:
+                    beta = math.sqrt(self.rave_k / (3 * visits + self.rave_k))
+                    value = (1 - beta) * value + beta * stats[1] / stats[0]
+            weight = value + c * math.sqrt(2 * (log_n - child_log_visits[i]))
+            if weight > best_weight:
+                best_i = i
+                best_weight = weight
+        if best_weight == -math.inf and self.untried_actions:
+            # Every expanded move is a proven loss, try another one
+            return self.untried_actions[-1]
+        return self.child_actions[best_i]
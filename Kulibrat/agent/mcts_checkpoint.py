@@ -0,0 +1,138 @@
+"""
+Compact binary checkpoints of MCTS search trees
+
+    header : b"KMCT", version, root max_score, node count, root packed state
+    nodes  : fixed size records in breadth first order, so the children of a node
+             are contiguous: first child index, number of children, code of the
+             move leading to the node, proven winner, visits, black and red results
+
+A checkpoint is opened memory mapped and the nodes are read only when the search
+reaches them (see MCTS.restore), so trees bigger than the memory can be used.
+The RAVE statistics are not stored.
+"""
+from __future__ import annotations
+from collections import deque
+from typing import Dict, Iterator, Tuple, Union
+import mmap
+import os
+import struct
+
+from Kulibrat.game.game import Kulibrat, Player
+
+MAGIC = b"KMCT"
+VERSION = 1
+ROOT_CODE = 0xFF
+
+HEADER = struct.Struct("<4sBxHIQ")
+NODE = struct.Struct("<IBBBxIdd")
+
+# (first child, children, move code, proven, visits, black results, red results)
+NodeRecord = Tuple[int, int, int, int, int, float, float]
+
+
+def encode_proven(player: Player) -> int:
+    return player.value + 1
+
+
+def decode_proven(value: int) -> Player:
+    return Player(value - 1)
+
+
+class TreeCheckpoint:
+    """
+    Read only, memory mapped access to a saved tree
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self.buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.max_score, self.size, self.root_state = HEADER.unpack_from(
+            self.buffer, 0
+        )
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a search tree checkpoint")
+
+    def node(self, index: int) -> NodeRecord:
+        return NODE.unpack_from(self.buffer, HEADER.size + index * NODE.size)
+
+    def children(self, index: int) -> Dict[int, int]:
+        """
+        Returns move code -> node index of the children of a node
+        """
+        first, n_children = self.node(index)[:2]
+        return {self.node(i)[2]: i for i in range(first, first + n_children)}
+
+    def matches(self, state: Kulibrat) -> bool:
+        return state.pack() == self.root_state and state.max_score == self.max_score
+
+    def close(self):
+        self.buffer.close()
+        self._file.close()
+
+    def __enter__(self) -> TreeCheckpoint:
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# An element of the tree being saved: a node in memory or a node of a checkpoint
+# not yet restored
+_Item = Union["MCTS", Tuple[TreeCheckpoint, int]]
+
+
+def _children(item: _Item) -> Iterator[Tuple[int, _Item]]:
+    if isinstance(item, tuple):
+        checkpoint, index = item
+        first, n_children = checkpoint.node(index)[:2]
+        for i in range(first, first + n_children):
+            yield checkpoint.node(i)[2], (checkpoint, i)
+    elif item.checkpoint is not None:
+        # Children still on the checkpoint
+        for code, i in item.checkpoint.children(item.checkpoint_index).items():
+            yield code, (item.checkpoint, i)
+    else:
+        for code, child in zip(item.child_codes, item.child_nodes):
+            yield code, child
+
+
+def _stats(item: _Item) -> Tuple[int, int, float, float]:
+    if isinstance(item, tuple):
+        checkpoint, index = item
+        _, _, _, proven, visits, black, red = checkpoint.node(index)
+        return proven, visits, black, red
+    return (
+        encode_proven(item.proven),
+        item.number_of_visits,
+        item.results[Player.BLACK],
+        item.results[Player.RED],
+    )
+
+
+def save_tree(root, path: str) -> int:
+    """
+    Writes the tree below root (an MCTS node) to path, including the parts still
+    lazily backed by a checkpoint. Returns the number of nodes.
+    The file is replaced atomically, so a crash never leaves a broken checkpoint
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(bytes(HEADER.size))
+        queue = deque([(ROOT_CODE, root)])
+        next_index = 1
+        count = 0
+        while queue:
+            code, item = queue.popleft()
+            children = list(_children(item))
+            proven, visits, black, red = _stats(item)
+            f.write(
+                NODE.pack(next_index, len(children), code, proven, visits, black, red)
+            )
+            queue.extend(children)
+            next_index += len(children)
+            count += 1
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, root.state.max_score, count, root.state.pack()))
+    os.replace(tmp_path, path)
+    return count
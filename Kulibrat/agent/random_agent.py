@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 from Kulibrat.game.agent import Agent
 import random
 
@@ -10,14 +10,23 @@ class RandomAgent(Agent):
     Agent that chooses random moves
     """
 
-    def __init__(self, game: Kulibrat, player: Player):
+    def __init__(
+        self, game: Kulibrat, player: Player, rng: Optional[random.Random] = None
+    ):
+        """
+        rng : random.Random
+        ---
+        The random stream used to pick the moves. If None a new stream seeded
+        from the OS entropy source is used
+        """
         super().__init__(game, player)
         self.player = player
+        self.rng = rng if rng is not None else random.Random()
 
     def choose_move(
         self, actions: List[Action], previous_actions: List[Action]
     ) -> Action:
-        action = random.choice(actions)
+        action = self.rng.choice(actions)
         return action
 
     def __str__(self):
@@ -0,0 +1,124 @@
+"""
+Perft: number of leaf positions reachable in exactly depth plies
+
+A ply is an execute_action, so the turn skip of post_turn is included. Finished
+games have no moves and contribute no leaves below them. Other move generators can
+be validated comparing their divide output (leaves below every root move, keyed by
+the integer move encoding) with the one of the reference implementation.
+
+    python -m Kulibrat.analysis.perft 6 --divide --cache --processes 4
+"""
+from __future__ import annotations
+from multiprocessing import Pool
+from typing import Dict, Optional, Tuple
+import argparse
+import time
+
+from Kulibrat.game.game import Kulibrat
+
+# (packed state, depth) -> leaves
+PerftCache = Dict[Tuple[int, int], int]
+
+
+def perft(state: Kulibrat, depth: int, cache: Optional[PerftCache] = None) -> int:
+    """
+    Counts the leaves at the given depth. With a cache the counts of transposed
+    positions are reused
+    """
+    if depth == 0:
+        return 1
+    if state.check_game_over():
+        return 0
+    actions = state.allowed_actions
+    if depth == 1:
+        # Every move reaches a leaf
+        return len(actions)
+    if cache is not None:
+        key = (state.pack(), depth)
+        if key in cache:
+            return cache[key]
+    leaves = 0
+    for action in actions:
+        child = state.copy_state()
+        child.execute_action(action)
+        leaves += perft(child, depth - 1, cache)
+    if cache is not None:
+        cache[key] = leaves
+    return leaves
+
+
+def _perft_move(job) -> int:
+    packed, max_score, code, depth, use_cache = job
+    state = Kulibrat.from_packed(packed, max_score)
+    state.execute_action(state.decode_action(code))
+    return perft(state, depth - 1, {} if use_cache else None)
+
+
+def divide(
+    state: Kulibrat, depth: int, cache: bool = False, processes: int = 1
+) -> Dict[int, int]:
+    """
+    Leaves below every root move (by move code). With processes > 1 the root moves
+    are counted in parallel, every process with its own cache
+    """
+    if depth == 0 or state.check_game_over():
+        return {}
+    jobs = [
+        (state.pack(), state.max_score, action.encode(), depth, cache)
+        for action in state.allowed_actions
+    ]
+    if processes > 1:
+        with Pool(processes) as pool:
+            counts = pool.map(_perft_move, jobs)
+    else:
+        shared: Optional[PerftCache] = {} if cache else None
+        counts = []
+        for packed, max_score, code, depth_, _ in jobs:
+            child = state.copy_state()
+            child.execute_action(child.decode_action(code))
+            counts.append(perft(child, depth_ - 1, shared))
+    return {job[2]: count for job, count in zip(jobs, counts)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Counts the positions reachable in depth plies"
+    )
+    add_arguments(parser)
+    run(parser.parse_args(argv))
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("depth", type=int)
+    parser.add_argument("--max-score", type=int, default=5)
+    parser.add_argument(
+        "--moves",
+        default="",
+        help="comma separated move codes played from the initial position",
+    )
+    parser.add_argument("--divide", action="store_true", help="leaves per root move")
+    parser.add_argument("--cache", action="store_true", help="transposition cache")
+    parser.add_argument("--processes", type=int, default=1)
+
+
+def run(args: argparse.Namespace):
+    state = Kulibrat(max_score=args.max_score)
+    for code in filter(None, args.moves.split(",")):
+        state.execute_action(state.decode_action(int(code)))
+    start = time.perf_counter()
+    if args.divide or args.processes > 1:
+        counts = divide(state, args.depth, args.cache, args.processes)
+        names = {action.encode(): str(action) for action in state.allowed_actions}
+        if args.divide:
+            for code, count in counts.items():
+                print(f"{code:>4} {names[code]}: {count}")
+        leaves = sum(counts.values()) if args.depth > 0 else 1
+    else:
+        leaves = perft(state, args.depth, {} if args.cache else None)
+    elapsed = time.perf_counter() - start
+    print(f"perft({args.depth}) = {leaves}")
+    print(f"{elapsed:.3f} s, {leaves / elapsed if elapsed > 0 else 0:.0f} leaves/s")
+
+
+if __name__ == "__main__":
+    main()
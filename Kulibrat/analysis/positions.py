@@ -0,0 +1,199 @@
+"""
+Batch analysis of positions
+
+Positions are given as packed states (Kulibrat.pack), as lists of move codes played
+from the initial position or as Kulibrat states. Equal positions are analyzed once,
+the analyses are spread over a process pool and stored in a persistent cache.
+"""
+from __future__ import annotations
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+from multiprocessing import Pool
+import itertools
+import json
+import random
+import sqlite3
+
+from Kulibrat.game.game import Kulibrat
+from Kulibrat.tournament.runner import derive_seed
+from Kulibrat.tournament.spec import AgentSpec
+
+Position = Union[int, Sequence[int], Kulibrat]
+
+
+class AnalysisResult:
+    """
+    best_move is the integer encoding of the chosen move (None if the game is over),
+    value its average reward for the player to move and visits its visit count
+    """
+
+    def __init__(
+        self,
+        packed: int,
+        best_move: Optional[int],
+        move: str,
+        value: Optional[float],
+        visits: int,
+    ):
+        self.packed = packed
+        self.best_move = best_move
+        self.move = move
+        self.value = value
+        self.visits = visits
+
+    def to_json(self) -> str:
+        return json.dumps(self.__dict__)
+
+    @classmethod
+    def from_json(cls, text: str) -> AnalysisResult:
+        return cls(**json.loads(text))
+
+    def __repr__(self):
+        return f"AnalysisResult({self.move}, value={self.value}, visits={self.visits})"
+
+
+class AnalysisCache:
+    """
+    Persistent cache of analyses stored in a SQLite database, bounded to max_entries:
+    when it is full the least recently used entries are evicted
+    """
+
+    def __init__(self, path: str = ":memory:", max_entries: int = 1_000_000):
+        self.max_entries = max_entries
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS analysis "
+            "(key TEXT PRIMARY KEY, result TEXT NOT NULL, used INTEGER NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS analysis_used ON analysis (used)")
+        (self.clock,) = self.db.execute(
+            "SELECT COALESCE(MAX(used), 0) FROM analysis"
+        ).fetchone()
+        (self.size,) = self.db.execute("SELECT COUNT(*) FROM analysis").fetchone()
+
+    def get(self, key: str) -> Optional[AnalysisResult]:
+        row = self.db.execute(
+            "SELECT result FROM analysis WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        self.clock += 1
+        self.db.execute("UPDATE analysis SET used = ? WHERE key = ?", (self.clock, key))
+        return AnalysisResult.from_json(row[0])
+
+    def put(self, key: str, result: AnalysisResult):
+        self.clock += 1
+        inserted = self.db.execute(
+            "INSERT OR REPLACE INTO analysis VALUES (?, ?, ?)",
+            (key, result.to_json(), self.clock),
+        ).rowcount
+        self.size += inserted
+        if self.size > self.max_entries:
+            excess = self.size - self.max_entries
+            self.db.execute(
+                "DELETE FROM analysis WHERE key IN "
+                "(SELECT key FROM analysis ORDER BY used LIMIT ?)",
+                (excess,),
+            )
+            (self.size,) = self.db.execute("SELECT COUNT(*) FROM analysis").fetchone()
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+def to_state(position: Position, max_score: int = 5) -> Kulibrat:
+    """
+    Builds the state of a position given in any of the supported forms
+    (max_score is not used for Kulibrat states)
+    """
+    if isinstance(position, Kulibrat):
+        return position
+    if isinstance(position, int):
+        return Kulibrat.from_packed(position, max_score)
+    state = Kulibrat(max_score=max_score)
+    for code in position:
+        state.execute_action(state.decode_action(code))
+    return state
+
+
+def evaluate_position(
+    packed: int, max_score: int, engine: str, seed: int
+) -> AnalysisResult:
+    """
+    Runs a search of the engine (an AgentSpec of an MCTS agent) on the position
+    """
+    state = Kulibrat.from_packed(packed, max_score)
+    if state.check_game_over():
+        return AnalysisResult(packed, None, "", None, 0)
+    agent = AgentSpec.parse(engine)(
+        state, state.turn, rng=random.Random(derive_seed(seed, packed))
+    )
+    root = agent.tree_root
+    action = root.simulation()
+    child = root[action]
+    value = child.q() / child.number_of_visits if child.number_of_visits else None
+    return AnalysisResult(
+        packed, action.encode(), repr(action), value, child.number_of_visits
+    )
+
+
+def _evaluate(job) -> AnalysisResult:
+    return evaluate_position(*job)
+
+
+def analyze(
+    positions: Iterable[Position],
+    engine: Union[str, AgentSpec] = "mcts:max_sim=100",
+    budget: Optional[int] = None,
+    max_score: int = 5,
+    seed: int = 0,
+    processes: int = 1,
+    cache: Optional[AnalysisCache] = None,
+    chunk_size: int = 256,
+) -> Iterator[AnalysisResult]:
+    """
+    Yields the analysis of every position in input order.
+    budget overrides the max_sim of the engine. max_score applies to the positions
+    given as packed states or moves, Kulibrat states keep their own. The positions are read chunk_size
+    at a time; the missing analyses of a chunk (one per distinct position) are
+    computed in parallel before its results are yielded
+    """
+    spec = engine if isinstance(engine, AgentSpec) else AgentSpec.parse(engine)
+    if spec.kind != "mcts":
+        raise ValueError("Only MCTS engines can analyze positions")
+    if budget is not None:
+        spec = spec.replace(max_sim=budget)
+    engine = str(spec)
+    cache = cache if cache is not None else AnalysisCache()
+    pool = Pool(processes) if processes > 1 else None
+    positions = iter(positions)
+    try:
+        while True:
+            chunk = list(itertools.islice(positions, chunk_size))
+            if not chunk:
+                break
+            # A state keeps its own max_score
+            states = [to_state(p, max_score) for p in chunk]
+            keys = [f"{s.pack()}|{s.max_score}|{engine}|{seed}" for s in states]
+            results = {}
+            missing: List[Tuple[str, Kulibrat]] = []
+            for key, state in zip(keys, states):
+                if key in results:
+                    continue
+                results[key] = cache.get(key)
+                if results[key] is None:
+                    missing.append((key, state))
+            jobs = [(s.pack(), s.max_score, engine, seed) for _, s in missing]
+            computed = pool.imap(_evaluate, jobs) if pool else map(_evaluate, jobs)
+            for (key, _), result in zip(missing, computed):
+                results[key] = result
+                cache.put(key, result)
+            cache.commit()
+            for key in keys:
+                yield results[key]
+    finally:
+        if pool is not None:
+            pool.terminate()
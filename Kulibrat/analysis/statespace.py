@@ -0,0 +1,335 @@
+"""
+Breadth first enumeration of the states reachable from the initial position
+
+States are identified by a perfect hash of the board occupancy (every cell empty,
+black or red), the scores and the turn. Pawn numbers are dropped: they only decide
+which reserve pawn spawns next, so states differing only by numbering have the same
+moves. The reserve is implied by the occupancy, the winner by the scores.
+The visited set is a bitset over the hash space, kept in memory or in a file of
+spill_dir, as are the BFS layers once they exceed memory_limit states.
+The moves reaching known states are split in transpositions (into the next layer)
+and back moves (into an earlier or the same layer): every cycle has one.
+
+    ((occupancy * (max_score + 1) + black score) * (max_score + 1) + red score) * 2 + turn
+"""
+from __future__ import annotations
+from array import array
+from collections import Counter
+from multiprocessing import Pool
+from typing import Dict, Iterator, List, Optional, Tuple
+import mmap
+import os
+import tempfile
+
+import Kulibrat.game.game as Game
+from Kulibrat.game.game import Coord, Grid, Kulibrat, Player
+
+
+def hash_space(max_score: int) -> int:
+    """
+    Number of state hashes of the current board configuration
+    """
+    return 3 ** (Game.N_ROWS * Game.N_COLS) * (max_score + 1) ** 2 * 2
+
+
+def state_hash(state: Kulibrat) -> int:
+    occupancy = 0
+    for player in (Player.BLACK, Player.RED):
+        for pawn in state.pawns[player]:
+            if pawn.position is not None:
+                cell = pawn.position.row * Game.N_COLS + pawn.position.col
+                occupancy += (player.value + 1) * 3 ** cell
+    max_score = state.max_score
+    scores = state.score[Player.BLACK] * (max_score + 1) + state.score[Player.RED]
+    return (occupancy * (max_score + 1) ** 2 + scores) * 2 + state.turn.value
+
+
+def state_from_hash(index: int, max_score: int) -> Kulibrat:
+    """
+    Builds a state with the given hash, pawns are numbered in cell order
+    """
+    state = Kulibrat(max_score=max_score)
+    state.turn = Player(index & 1)
+    index >>= 1
+    index, red_score = divmod(index, max_score + 1)
+    occupancy, black_score = divmod(index, max_score + 1)
+    state.score[Player.BLACK] = black_score
+    state.score[Player.RED] = red_score
+    placed = {Player.BLACK: 0, Player.RED: 0}
+    for cell in range(Game.N_ROWS * Game.N_COLS):
+        occupancy, value = divmod(occupancy, 3)
+        if value:
+            player = Player(value - 1)
+            pawn = state.pawns[player][placed[player]]
+            pawn.position = Coord(cell // Game.N_COLS, cell % Game.N_COLS)
+            placed[player] += 1
+    state.grid = Grid.grid_from_pawns(state.pawns)
+    for player in (Player.BLACK, Player.RED):
+        if state.score[player] >= max_score:
+            state.winner = player
+    return state
+
+
+class Bitset:
+    """
+    Fixed size bitset, in memory or memory mapped on a temporary file of directory
+    """
+
+    def __init__(self, size: int, directory: Optional[str] = None):
+        n_bytes = size // 8 + 1
+        self.path = None
+        if directory is None:
+            self.bits = bytearray(n_bytes)
+        else:
+            fd, self.path = tempfile.mkstemp(suffix=".visited", dir=directory)
+            os.ftruncate(fd, n_bytes)
+            self.bits = mmap.mmap(fd, n_bytes)
+            os.close(fd)
+
+    def add(self, i: int) -> bool:
+        """
+        Sets bit i, returns False if it was already set
+        """
+        byte, bit = i >> 3, 1 << (i & 7)
+        if self.bits[byte] & bit:
+            return False
+        self.bits[byte] |= bit
+        return True
+
+    def discard(self, i: int):
+        self.bits[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+
+    def __contains__(self, i: int) -> bool:
+        return bool(self.bits[i >> 3] & (1 << (i & 7)))
+
+    def close(self):
+        if self.path is not None:
+            self.bits.close()
+            os.remove(self.path)
+
+
+class Frontier:
+    """
+    The state hashes of a BFS layer. Up to memory_limit hashes are kept in memory,
+    with a spill_dir the others are appended to a temporary file
+    """
+
+    def __init__(self, spill_dir: Optional[str] = None, memory_limit: int = 1 << 22):
+        self.spill_dir = spill_dir
+        self.memory_limit = memory_limit
+        self.buffer = array("Q")
+        self.path: Optional[str] = None
+        self.size = 0
+
+    def append(self, index: int):
+        self.buffer.append(index)
+        self.size += 1
+        if self.spill_dir is not None and len(self.buffer) >= self.memory_limit:
+            if self.path is None:
+                fd, self.path = tempfile.mkstemp(suffix=".frontier", dir=self.spill_dir)
+                os.close(fd)
+            with open(self.path, "ab") as f:
+                self.buffer.tofile(f)
+            self.buffer = array("Q")
+
+    def __len__(self) -> int:
+        return self.size
+
+    def chunks(self, size: int) -> Iterator[array]:
+        if self.path is not None:
+            with open(self.path, "rb") as f:
+                while True:
+                    data = f.read(size * self.buffer.itemsize)
+                    if not data:
+                        break
+                    chunk = array("Q")
+                    chunk.frombytes(data)
+                    yield chunk
+        for start in range(0, len(self.buffer), size):
+            yield self.buffer[start : start + size]
+
+    def close(self):
+        if self.path is not None:
+            os.remove(self.path)
+            self.path = None
+
+
+class Layer:
+    """
+    Statistics of the states at a BFS depth
+    """
+
+    def __init__(self, depth: int):
+        self.depth = depth
+        self.states = 0
+        self.terminal = 0
+        # Moves of the layer states. Transpositions reach a state of the next
+        # layer already found from another state; back moves reach a state of an
+        # earlier or of the same layer. Every cycle (i.e. a capture sending a pawn
+        # back to the reserve and the pawn coming back) has at least a back move,
+        # so the state graph is acyclic if there are none
+        self.edges = 0
+        self.transpositions = 0
+        self.back_edges = 0
+
+    def __str__(self):
+        return (
+            f"{self.depth:>4} {self.states:>10} {self.terminal:>10} "
+            f"{self.edges:>11} {self.transpositions:>11} {self.back_edges:>11}"
+        )
+
+
+class StateSpace:
+    def __init__(self, config: Tuple[int, int, int], max_score: int):
+        self.config = config
+        self.max_score = max_score
+        self.layers: List[Layer] = []
+        # Number of moves -> number of non terminal states
+        self.branching: Counter = Counter()
+
+    @property
+    def states(self) -> int:
+        return sum(layer.states for layer in self.layers)
+
+    @property
+    def terminal(self) -> int:
+        return sum(layer.terminal for layer in self.layers)
+
+    @property
+    def edges(self) -> int:
+        return sum(layer.edges for layer in self.layers)
+
+    @property
+    def back_edges(self) -> int:
+        return sum(layer.back_edges for layer in self.layers)
+
+    def mean_branching(self) -> float:
+        expanded = sum(self.branching.values())
+        return self.edges / expanded if expanded else 0.0
+
+    def report(self) -> str:
+        rows, cols, pawns = self.config
+        lines = [
+            f"Board {rows}x{cols}, {pawns} pawns, max score {self.max_score}",
+            f"{'Depth':>4} {'States':>10} {'Terminal':>10} {'Moves':>11} "
+            f"{'Transposed':>11} {'Back':>11}",
+        ]
+        lines += [str(layer) for layer in self.layers]
+        lines.append(
+            f"Reachable states {self.states}, terminal {self.terminal}, "
+            f"moves {self.edges}, mean branching {self.mean_branching():.2f}"
+        )
+        lines.append(
+            f"Back moves {self.back_edges}"
+            + (" (no cycles)" if self.back_edges == 0 else " (every cycle has one)")
+        )
+        lines.append("Branching factor distribution:")
+        lines += [
+            f"{moves:>4} {count:>10}" for moves, count in sorted(self.branching.items())
+        ]
+        return "\n".join(lines)
+
+
+def expand(indices: array, max_score: int) -> Tuple[array, Dict[int, int], int]:
+    """
+    Returns the successors (with repetitions) of the given states, the branching
+    factor counts and the number of terminal states
+    """
+    successors = array("Q")
+    branching: Dict[int, int] = Counter()
+    terminal = 0
+    for index in indices:
+        state = state_from_hash(index, max_score)
+        if state.check_game_over():
+            terminal += 1
+            continue
+        actions = state.allowed_actions
+        branching[len(actions)] += 1
+        for action in actions:
+            child = state.copy_state()
+            child.execute_action(action)
+            successors.append(state_hash(child))
+    return successors, branching, terminal
+
+
+def _init_worker(config: Tuple[int, int, int]):
+    Game.configure_board(*config)
+
+
+def _expand(job) -> Tuple[array, Dict[int, int], int]:
+    return expand(*job)
+
+
+def explore(
+    max_score: int = 5,
+    config: Optional[Tuple[int, int, int]] = None,
+    max_depth: Optional[int] = None,
+    processes: int = 1,
+    spill_dir: Optional[str] = None,
+    memory_limit: int = 1 << 22,
+    chunk_size: int = 4096,
+    verbose: bool = False,
+) -> StateSpace:
+    """
+    Enumerates the states reachable with the board config (rows, cols, pawns),
+    by default the current one, layer by layer up to max_depth.
+    The layers are expanded chunk_size states at a time, in parallel with
+    processes > 1; the results are merged in order, so they do not depend on it.
+    Raises ValueError if the state hashes of the board do not fit in 64 bits
+    """
+    previous = Game.board_config()
+    config = config or previous
+    if max_score < 1:
+        raise ValueError("max_score must be at least 1")
+    rows, cols, _ = config
+    if 3 ** (rows * cols) * (max_score + 1) ** 2 * 2 > 1 << 64:
+        raise ValueError("The state hashes of this board do not fit in 64 bits")
+    Game.configure_board(*config)
+    visited = Bitset(hash_space(max_score), spill_dir)
+    # The states of the layer being built, to tell transpositions from back moves
+    next_layer = Bitset(hash_space(max_score), spill_dir)
+    pool = Pool(processes, _init_worker, (config,)) if processes > 1 else None
+    space = StateSpace(config, max_score)
+    frontier = Frontier(spill_dir, memory_limit)
+    try:
+        start = state_hash(Kulibrat(max_score=max_score))
+        visited.add(start)
+        frontier.append(start)
+        depth = 0
+        while len(frontier) and (max_depth is None or depth <= max_depth):
+            layer = Layer(depth)
+            layer.states = len(frontier)
+            following = Frontier(spill_dir, memory_limit)
+            jobs = ((chunk, max_score) for chunk in frontier.chunks(chunk_size))
+            results = pool.imap(_expand, jobs) if pool else map(_expand, jobs)
+            for successors, branching, terminal in results:
+                layer.terminal += terminal
+                layer.edges += len(successors)
+                space.branching.update(branching)
+                if max_depth is not None and depth == max_depth:
+                    continue
+                for index in successors:
+                    if visited.add(index):
+                        following.append(index)
+                        next_layer.add(index)
+                    elif index in next_layer:
+                        layer.transpositions += 1
+                    else:
+                        layer.back_edges += 1
+            for chunk in following.chunks(chunk_size):
+                for index in chunk:
+                    next_layer.discard(index)
+            frontier.close()
+            frontier = following
+            space.layers.append(layer)
+            if verbose:
+                print(layer)
+            depth += 1
+    finally:
+        frontier.close()
+        visited.close()
+        next_layer.close()
+        if pool is not None:
+            pool.terminate()
+        Game.configure_board(*previous)
+    return space
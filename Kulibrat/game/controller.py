@@ -1,3 +1,5 @@
+from typing import Optional, Tuple
+
 from Kulibrat.game.agent import Agent
 from Kulibrat.game.game import Kulibrat, Player
 import Kulibrat.game.view as View
@@ -8,18 +10,41 @@ class Controller:
     The controller requests moves to the agents (whetever their are human or AI) and applies it to the game
     """
 
-    def __init__(self, game: Kulibrat, player_black: Agent, player_red: Agent):
+    def __init__(
+        self,
+        game: Kulibrat,
+        player_black: Agent,
+        player_red: Agent,
+        recorder=None,
+        descriptions: Optional[Tuple[str, str]] = None,
+    ):
+        """
+        recorder
+        ---
+        Optional object receiving the game while it is played
+        (i.e. GameRecordWriter or GameRecordBuffer from Kulibrat.game.record)
+
+        descriptions
+        ---
+        Black and red agent descriptions given to the recorder, str of the agents
+        by default
+        """
         self.game = game
         self.views = {Player.BLACK: player_black, Player.RED: player_red}
+        self.recorder = recorder
+        self.descriptions = descriptions or (str(player_black), str(player_red))
 
-    def play(self) -> Player:
+    def play(self, verbose: bool = True) -> Player:
         """
         Starts a game with the two agent and manages it till the end
         Don't call this method twice, but create a new controller with two
         new agents (Agents could be stateful)
+        If verbose is False the winner is not printed
         """
         prev_turn = Player.EMPTY
         prev_actions_list = []
+        if self.recorder is not None:
+            self.recorder.begin_game(self.game.max_score, *self.descriptions)
         while self.game.winner == Player.EMPTY:
             curr_turn = self.game.turn
             if curr_turn != prev_turn:
@@ -37,10 +62,15 @@ class Controller:
                 action
             )  # Add the current action the the previous action list
             prev_turn = self.game.turn
+            if self.recorder is not None:
+                self.recorder.record(action)
             self.game.execute_action(action)
             # View.draw_grid(self.game)
             # print(self.game.score)
 
-        print(f"Player {self.game.winner.name} Won!")
+        if self.recorder is not None:
+            self.recorder.end_game()
+        if verbose:
+            print(f"Player {self.game.winner.name} Won!")
 
         return self.game.winner
@@ -1,7 +1,7 @@
 from __future__ import annotations
-from typing import Dict, List, Tuple, Optional, Union, Iterable
+from typing import Dict, List, Mapping, Tuple, Optional, Union, Iterable
 from enum import Enum
-import copy
+from types import MappingProxyType
 
 N_ROWS = 4
 N_COLS = 3
@@ -12,6 +12,20 @@ WEST = 1
 
 WIN_SCORE = 5
 
+# Integer move encoding
+# A move is identified by its source cell (0 is the reserve, used by spawns)
+# and by its destination cell (goal rows included):
+# code = source * N_DEST_CELLS + destination
+N_DEST_CELLS = (N_ROWS + 2) * N_COLS
+N_MOVE_CODES = (N_ROWS * N_COLS + 1) * N_DEST_CELLS
+
+# Packed state layout (see Kulibrat.pack), from the least significant bit:
+# the source_index of every pawn (black then red, by number), the turn,
+# the winner (0 for none, 1 + Player.value otherwise) and the two scores
+CELL_BITS = (N_ROWS * N_COLS).bit_length()
+SCORE_BITS = 8
+PACKED_BITS = 2 * N_PAWNS * CELL_BITS + 3 + 2 * SCORE_BITS
+
 
 class Player(Enum):
     """
@@ -92,12 +106,32 @@ class Player(Enum):
             return "E"
 
 
-# Color EMPTY means no pawn in the square
-# WHen color is EMPTY, the number is unspecified
+# Coordinates are interned: every Coord(row, col) inside the grid (goal rows and
+# the columns next to the board included) returns the same immutable instance
+# from a fixed table, indexed by Coord.index
+TABLE_ROWS = N_ROWS + 2
+TABLE_COLS = N_COLS + 2
+
+
 class Coord:
-    def __init__(self, row: int, col: int):
-        self.row = row
-        self.col = col
+    __slots__ = ("row", "col", "index")
+
+    def __new__(cls, row: int, col: int):
+        if -1 <= row <= N_ROWS and -1 <= col <= N_COLS:
+            return _COORDS[(row + 1) * TABLE_COLS + col + 1]
+        return cls._make(row, col, -1)
+
+    @classmethod
+    def _make(cls, row: int, col: int, index: int) -> Coord:
+        coord = object.__new__(cls)
+        object.__setattr__(coord, "row", row)
+        object.__setattr__(coord, "col", col)
+        object.__setattr__(coord, "index", index)
+        return coord
+
+    def __setattr__(self, name, value):
+        # Instances are shared by every state through the table
+        raise AttributeError("Coord is immutable")
 
     def __add__(self, other):
         if isinstance(other, Coord):
@@ -108,16 +142,28 @@ class Coord:
             raise TypeError("Invalid tuple")
 
     def __eq__(self, other):
+        if self is other:
+            return True
         if isinstance(other, Coord):
-            return (self.row, self.col) == (other.row, other.col)
+            return self.row == other.row and self.col == other.col
         elif isinstance(other, tuple):
             return (self.row, self.col) == other
         else:
             return False
 
     def __hash__(self):
+        # Same hash of the equal tuple
         return hash((self.row, self.col))
 
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return Coord, (self.row, self.col)
+
     def __repr__(self):
         if self.row >= N_ROWS or self.row < 0:
             return "GOAL"
@@ -125,6 +171,49 @@ class Coord:
             return f"({self.row}, {self.col})"
 
 
+def _make_coords() -> List[Coord]:
+    return [
+        Coord._make(i, j, (i + 1) * TABLE_COLS + j + 1)
+        for i in range(-1, N_ROWS + 1)
+        for j in range(-1, N_COLS + 1)
+    ]
+
+
+_COORDS = _make_coords()
+
+
+def configure_board(rows: int = 4, cols: int = 3, pawns: int = 4):
+    """
+    Changes the board size and the number of pawns of each player (the defaults are
+    the standard game). It affects the whole module: states, actions and packed
+    states created before are not valid anymore. Processes started with spawn
+    must configure the board again.
+    Packed states (see Kulibrat.pack) and game records are limited to the boards
+    whose states and moves fit in 64 bits and in a byte
+    """
+    global N_ROWS, N_COLS, N_PAWNS, N_DEST_CELLS, N_MOVE_CODES
+    global CELL_BITS, PACKED_BITS, TABLE_ROWS, TABLE_COLS, _COORDS
+    if rows < 1 or cols < 1 or pawns < 1:
+        raise ValueError("The board needs at least a row, a column and a pawn")
+    N_ROWS, N_COLS, N_PAWNS = rows, cols, pawns
+    N_DEST_CELLS = (N_ROWS + 2) * N_COLS
+    N_MOVE_CODES = (N_ROWS * N_COLS + 1) * N_DEST_CELLS
+    CELL_BITS = (N_ROWS * N_COLS).bit_length()
+    PACKED_BITS = 2 * N_PAWNS * CELL_BITS + 3 + 2 * SCORE_BITS
+    TABLE_ROWS = N_ROWS + 2
+    TABLE_COLS = N_COLS + 2
+    _COORDS = _make_coords()
+
+
+def board_config() -> Tuple[int, int, int]:
+    """
+    Returns (N_ROWS, N_COLS, N_PAWNS)
+    """
+    return N_ROWS, N_COLS, N_PAWNS
+
+
+# Color EMPTY means no pawn in the square
+# WHen color is EMPTY, the number is unspecified
 class Pawn:
     """
     Pawn object
@@ -133,6 +222,8 @@ class Pawn:
     number and position could be None
     """
 
+    __slots__ = ("player", "number", "position")
+
     def __init__(
         self,
         player: Player,
@@ -153,70 +244,80 @@ class Pawn:
         return self.position is not None
 
     def copy(self):
-        return Pawn(
-            copy.deepcopy(self.player),
-            self.number,
-            Coord(self.position.row, self.position.col) if self.position else None,
-        )
+        # Players and coordinates are immutable, they can be shared
+        return Pawn(self.player, self.number, self.position)
 
     def __eq__(self, other):
-        return (self.player, self.number) == (other.player, other.number)
+        return self.player is other.player and self.number == other.number
 
     def __hash__(self):
-        return hash((self.player, self.number))
+        number = self.number if self.number is not None else N_PAWNS
+        return (self.player.value + 1) * (N_PAWNS + 1) + number
 
     def __repr__(self):
         return f'{self.player.get_repr()}{str(self.number)}{self.position if self.position is not None else "(-,-)"}'
 
 
+# Shared by all the empty cells of all the grids, never modify it
+EMPTY_PAWN = Pawn(Player.EMPTY)
+
+
 class Grid:
     """
     A matrix containing pawns (including empty cells)
     Could be directly accessed supplying a tuple (i.e. grid[2,3]) or a Coord object
     """
 
+    __slots__ = ("cells",)
+
     def __init__(self):
-        self.grid = {
-            Coord(i, j): Pawn(Player.EMPTY, None, None)
-            for i in range(-1, N_ROWS + 1)
-            for j in range(-1, N_COLS + 1)
-        }
+        # Cells in the same order of the Coord table
+        self.cells: List[Pawn] = [EMPTY_PAWN] * len(_COORDS)
 
     def __eq__(self, other) -> bool:
         if type(self) != type(other):
             return False
-        return self.grid == other.grid
+        return self.cells == other.cells
 
-    def __getitem__(self, coord: Union[Tuple[int, int], Coord]):
+    @property
+    def grid(self) -> Mapping[Coord, Pawn]:
+        """
+        Read only view of the cells as coordinate -> pawn
+        (the goal rows and the columns next to the board included)
+        """
+        return MappingProxyType({coord: self.cells[coord.index] for coord in _COORDS})
+
+    @staticmethod
+    def _index(coord: Union[Tuple[int, int], Coord]) -> int:
         if isinstance(coord, Coord):
-            row, col = coord.row, coord.col
+            index = coord.index
         elif isinstance(coord, tuple):
-            row, col = coord
+            index = Coord(*coord).index
         else:
             raise TypeError("Invalid grid index type")
-        return self.grid[Coord(row, col)]
+        if index < 0:
+            raise KeyError(coord)
+        return index
+
+    def __getitem__(self, coord: Union[Tuple[int, int], Coord]):
+        return self.cells[self._index(coord)]
 
     def __setitem__(self, coord: Union[Tuple[int, int], Coord], new_value: Pawn):
-        if isinstance(coord, Coord):
-            row, col = coord.row, coord.col
-        elif isinstance(coord, tuple):
-            row, col = coord
-        else:
-            raise TypeError("Invalid grid index type")
-        self.grid[Coord(row, col)] = new_value
+        self.cells[self._index(coord)] = new_value
 
     @classmethod
     def grid_from_pawns(cls, pawns: Dict[Player, List[Pawn]]) -> Grid:
         new_grid = Grid()
+        cells = new_grid.cells
         for player in pawns.values():
             for pawn in player:
                 if pawn.position is not None:
-                    new_grid[pawn.position] = pawn
+                    cells[pawn.position.index] = pawn
         return new_grid
 
     def rows(self) -> Iterable[List[Pawn]]:
         for row_n in range(N_ROWS):
-            yield [self.grid[Coord(row_n, col)] for col in range(N_COLS)]
+            yield [self.cells[Coord(row_n, col).index] for col in range(N_COLS)]
 
 
 class Action:
@@ -226,6 +327,8 @@ class Action:
     and the pawn on which the action is applied
     """
 
+    __slots__ = ("player", "pawn")
+
     def __init__(self, player: Player, pawn: Pawn):
         self.player = player
         self.pawn = pawn
@@ -233,10 +336,10 @@ class Action:
     def __eq__(self, other):
         if type(self) != type(other):
             return False
-        return (self.player, self.pawn) == (other.player, other.pawn)
+        return self.player is other.player and self.pawn == other.pawn
 
     def __hash__(self):
-        return hash((self.player, self.pawn))
+        return hash(self.pawn)
 
     def __repr__(self):
         print(f"{str(type(self))} -> {str(self.player)}, {str(self.pawn)}")
@@ -249,11 +352,41 @@ class Action:
     def apply(self, game):
         pass
 
+    """
+    Abstract method. Returns the integer encoding of the action
+    (see source_index and dest_index)
+    """
+
+    def encode(self) -> int:
+        raise NotImplementedError
+
+
+def source_index(coord: Optional[Coord]) -> int:
+    """
+    Index of the starting cell of a move, 0 when the pawn comes from the reserve
+    """
+    if coord is None:
+        return 0
+    return 1 + coord.row * N_COLS + coord.col
+
+
+def dest_index(coord: Coord) -> int:
+    """
+    Index of the destination cell of a move, goal rows included
+    """
+    return (coord.row + 1) * N_COLS + coord.col
+
+
+def encode_move(source: Optional[Coord], dest: Coord) -> int:
+    return source_index(source) * N_DEST_CELLS + dest_index(dest)
+
 
 # Following classes are the possible actions
 
 
 class Spawn(Action):
+    __slots__ = ("position",)
+
     def __init__(self, player: Player, pawn: Pawn, spawn_col: int):
         super().__init__(player, pawn)
         if 0 <= spawn_col < N_COLS:
@@ -264,10 +397,10 @@ class Spawn(Action):
     def __eq__(self, other):
         if type(self) != type(other):
             return False
-        return (self.player, self.pawn, self.position) == (
-            other.player,
-            other.pawn,
-            other.position,
+        return (
+            self.player is other.player
+            and self.pawn == other.pawn
+            and self.position == other.position
         )
 
     def __repr__(self):
@@ -276,18 +409,24 @@ class Spawn(Action):
         )
 
     def __hash__(self):
-        return hash((self.player, self.pawn, self.position))
+        return hash(self.pawn) * len(_COORDS) + self.position.index
 
     def apply(self, game: Kulibrat):
         game.move_pawn(self.pawn, self.position)
 
+    def encode(self) -> int:
+        return encode_move(None, self.position)
+
 
 class DiagonalMove(Action):
+    __slots__ = ("direction", "dest")
+
     def __init__(self, player: Player, pawn: Pawn, direction):
         """
         Direction could be WEST or EAST
         """
         super().__init__(player, pawn)
+        self.direction = direction
         self.dest = Coord(
             pawn.position.row + player.row_dir(), pawn.position.col + direction
         )
@@ -295,23 +434,31 @@ class DiagonalMove(Action):
     def __eq__(self, other):
         if type(self) != type(other):
             return False
-        return (self.player, self.pawn, self.dest) == (
-            other.player,
-            other.pawn,
-            other.dest,
+        return (
+            self.player is other.player
+            and self.pawn == other.pawn
+            and self.dest == other.dest
         )
 
     def apply(self, game: Kulibrat):
         game.move_pawn(self.pawn, self.dest)
 
+    def encode(self) -> int:
+        source = Coord(
+            self.dest.row - self.player.row_dir(), self.dest.col - self.direction
+        )
+        return encode_move(source, self.dest)
+
     def __hash__(self):
-        return hash((self.player, self.pawn, self.dest))
+        return hash(self.pawn) * len(_COORDS) + self.dest.index
 
     def __repr__(self):
         return f"MOVE PAWN {str(self.pawn.number)} FROM {self.pawn.position} TO {self.dest}"
 
 
 class Attack(Action):
+    __slots__ = ("dest",)
+
     def __init__(self, player: Player, pawn: Pawn):
         super().__init__(player, pawn)
         self.dest = Coord(pawn.position.row + player.row_dir(), pawn.position.col)
@@ -319,23 +466,29 @@ class Attack(Action):
     def apply(self, game: Kulibrat):
         game.move_pawn(self.pawn, self.dest)
 
+    def encode(self) -> int:
+        source = Coord(self.dest.row - self.player.row_dir(), self.dest.col)
+        return encode_move(source, self.dest)
+
     def __eq__(self, other):
         if type(self) != type(other):
             return False
-        return (self.player, self.pawn, self.dest) == (
-            other.player,
-            other.pawn,
-            other.dest,
+        return (
+            self.player is other.player
+            and self.pawn == other.pawn
+            and self.dest == other.dest
         )
 
     def __hash__(self):
-        return hash((self.player, self.pawn, self.dest))
+        return hash(self.pawn) * len(_COORDS) + self.dest.index
 
     def __repr__(self):
         return f"ATTACK POSITION {self.dest} WITH PAWN {str(self.pawn.number)}"
 
 
 class Jump(Action):
+    __slots__ = ("jump", "dest")
+
     def __init__(self, player: Player, pawn: Pawn, jump: int):
         """
         jump contains the difference between the starting column and the destination column.
@@ -348,22 +501,89 @@ class Jump(Action):
     def apply(self, game):
         game.move_pawn(self.pawn, self.dest)
 
+    def encode(self) -> int:
+        return encode_move(Coord(self.dest.row - self.jump, self.dest.col), self.dest)
+
     def __eq__(self, other):
         if type(self) != type(other):
             return False
-        return (self.player, self.pawn, self.dest) == (
-            other.player,
-            other.pawn,
-            other.dest,
+        return (
+            self.player is other.player
+            and self.pawn == other.pawn
+            and self.dest == other.dest
         )
 
     def __hash__(self):
-        return hash((self.player, self.pawn, self.dest))
+        return hash(self.pawn) * len(_COORDS) + self.dest.index
 
     def __repr__(self):
         return f"JUMP TO {str(self.dest)} WITH PAWN {str(self.pawn.number)}"
 
 
+def _compact_actions(
+    board: List[int], positions: List[List[int]], turn: int
+) -> List[Tuple[int, int, int]]:
+    """
+    The legal moves of turn on a compact board (see Kulibrat.random_playout), as
+    (pawn number, destination row, destination col) in the same order of
+    Kulibrat.generate_actions. board holds player * N_PAWNS + number for every cell
+    (-1 if empty), positions the cell of every pawn (-1 in the reserve). The goal
+    cells are always empty, pawns reaching them score at once
+    """
+    rows, cols = N_ROWS, N_COLS
+    d_row = 1 if turn == 0 else -1
+    mine = positions[turn]
+    moves = []
+    # Spawn of the reserve pawn with the lowest number
+    for number, cell in enumerate(mine):
+        if cell < 0:
+            row = 0 if turn == 0 else rows - 1
+            for col in range(cols):
+                if board[row * cols + col] < 0:
+                    moves.append((number, row, col))
+            break
+    # Diagonal moves, east then west
+    for number, cell in enumerate(mine):
+        if cell >= 0:
+            row = cell // cols + d_row
+            col = cell % cols
+            for dest_col in (col - 1, col + 1):
+                if 0 <= dest_col < cols and (
+                    not 0 <= row < rows or board[row * cols + dest_col] < 0
+                ):
+                    moves.append((number, row, dest_col))
+    # Attacks
+    for number, cell in enumerate(mine):
+        if cell >= 0:
+            row = cell // cols + d_row
+            if 0 <= row < rows:
+                other = board[row * cols + cell % cols]
+                if other >= 0 and other // N_PAWNS != turn:
+                    moves.append((number, row, cell % cols))
+    # Jumps over a line of opponent pawns
+    for number, cell in enumerate(mine):
+        if cell >= 0:
+            row = cell // cols + d_row
+            col = cell % cols
+            if not 0 <= row < rows:
+                continue
+            other = board[row * cols + col]
+            if other < 0 or other // N_PAWNS == turn:
+                continue
+            while True:
+                row += d_row
+                if not 0 <= row < rows:
+                    moves.append((number, row, col))
+                    break
+                other = board[row * cols + col]
+                if other < 0:
+                    moves.append((number, row, col))
+                    break
+                if other // N_PAWNS == turn:
+                    break
+    return moves
+
+
 class Kulibrat(object):
     """
     Game State class.
@@ -387,21 +607,90 @@ class Kulibrat(object):
             Player.BLACK: [Pawn(Player.BLACK, i) for i in range(N_PAWNS)],
             Player.RED: [Pawn(Player.RED, i) for i in range(N_PAWNS)],
         }
-        self.allowed_actions = self.get_possible_actions()
+        # Legal moves of the current state, computed when first requested
+        # and invalidated when the state changes (see allowed_actions)
+        self._allowed_actions: Optional[List[Action]] = None
         self.max_score = max_score
         self.winner = Player.EMPTY
 
     def copy_state(self) -> Kulibrat:
-        new = Kulibrat(max_score=self.max_score)
+        # Skip __init__, every field is overwritten
+        new = Kulibrat.__new__(Kulibrat)
+        new.max_score = self.max_score
         new.pawns = {
             Player.BLACK: [pawn.copy() for pawn in self.pawns[Player.BLACK]],
             Player.RED: [pawn.copy() for pawn in self.pawns[Player.RED]],
         }
         new.grid = Grid.grid_from_pawns(new.pawns)
-        new.turn = copy.deepcopy(self.turn)
-        new.score = copy.deepcopy(self.score)
-        new.winner = copy.deepcopy(self.winner)
-        new.allowed_actions = new.get_possible_actions()
+        # Players are immutable enums, no need to copy them
+        new.turn = self.turn
+        new.score = dict(self.score)
+        new.winner = self.winner
+        # Actions refer to pawns by color and number, so the copy can share the list
+        new._allowed_actions = self._allowed_actions
+        return new
+
+    @property
+    def allowed_actions(self) -> List[Action]:
+        """
+        The legal actions of the current state.
+        The list is cached and shared (also with the copies of the state),
+        it must not be modified
+        """
+        if self._allowed_actions is None:
+            self._allowed_actions = self.generate_actions()
+        return self._allowed_actions
+
+    @allowed_actions.setter
+    def allowed_actions(self, actions: List[Action]):
+        self._allowed_actions = actions
+
+    def pack(self) -> int:
+        """
+        Encodes the state (max_score excluded) in an integer of PACKED_BITS bits.
+        Equal states have equal packed values, so it can be used as hash key.
+        Raises ValueError if the board configuration needs more than 64 bits
+        """
+        if PACKED_BITS > 64:
+            raise ValueError(f"Packed states of this board need {PACKED_BITS} bits")
+        packed = 0
+        shift = 0
+        for player in (Player.BLACK, Player.RED):
+            for pawn in self.pawns[player]:
+                packed |= source_index(pawn.position) << shift
+                shift += CELL_BITS
+        packed |= self.turn.value << shift
+        shift += 1
+        packed |= (self.winner.value + 1) << shift
+        shift += 2
+        packed |= self.score[Player.BLACK] << shift
+        shift += SCORE_BITS
+        packed |= self.score[Player.RED] << shift
+        return packed
+
+    @classmethod
+    def from_packed(cls, packed: int, max_score: int = 5) -> Kulibrat:
+        """
+        Rebuilds a state encoded with pack
+        """
+        new = cls(max_score=max_score)
+        cell_mask = (1 << CELL_BITS) - 1
+        shift = 0
+        for player in (Player.BLACK, Player.RED):
+            for pawn in new.pawns[player]:
+                cell = (packed >> shift) & cell_mask
+                if cell:
+                    pawn.position = Coord((cell - 1) // N_COLS, (cell - 1) % N_COLS)
+                shift += CELL_BITS
+        new.grid = Grid.grid_from_pawns(new.pawns)
+        new.turn = Player((packed >> shift) & 1)
+        shift += 1
+        new.winner = Player(((packed >> shift) & 3) - 1)
+        shift += 2
+        score_mask = (1 << SCORE_BITS) - 1
+        new.score[Player.BLACK] = (packed >> shift) & score_mask
+        shift += SCORE_BITS
+        new.score[Player.RED] = (packed >> shift) & score_mask
         return new
 
     def __eq__(self, other) -> bool:
@@ -444,18 +733,18 @@ class Kulibrat(object):
             if goal_cell.player == self.turn:
                 self.score[self.turn] += 1
                 goal_cell.position = None
-                self.grid[self.turn.goal_row(), col] = Pawn(Player.EMPTY)
+                self.grid[self.turn.goal_row(), col] = EMPTY_PAWN
         # Check winning by reaching max score
         if self.score[self.turn] >= self.max_score:
             self.winner = self.turn
             return
         # Switch turn
         self.turn = self.turn.opponent()
-        self.allowed_actions = self.get_possible_actions()
+        self._allowed_actions = None
         # If no actions possible switch turn againKulibrat
         if len(self.allowed_actions) == 0:
             self.turn = self.turn.opponent()
-            self.allowed_actions = self.get_possible_actions()
+            self._allowed_actions = None
             # If no action possible after the switch then the last to move loses
             if len(self.allowed_actions) == 0:
                 self.winner = self.turn
@@ -474,6 +763,7 @@ class Kulibrat(object):
             raise ValueError("None pawn are not accepted")
 
         start_pos = pawn.position
+        self._allowed_actions = None
 
         dest_pawn = self.grid[dest]
         if dest_pawn.is_placed():
@@ -481,7 +771,7 @@ class Kulibrat(object):
         pawn.position = dest
 
         if start_pos is not None:
-            self.grid[start_pos] = Pawn(Player.EMPTY)
+            self.grid[start_pos] = EMPTY_PAWN
         self.grid[dest] = pawn
 
     def execute_action(self, action: Action) -> None:
@@ -495,7 +785,23 @@ class Kulibrat(object):
         action.apply(self)
         self.post_turn()
 
+    def decode_action(self, code: int) -> Action:
+        """
+        Returns the allowed action with the given integer encoding
+        """
+        for action in self.allowed_actions:
+            if action.encode() == code:
+                return action
+        raise ValueError(f"Move code {code} is not allowed in this state")
+
     def get_possible_actions(self) -> List[Action]:
+        """
+        Returns all the legal actions with regard to the current state of the game.
+        The list is cached (see allowed_actions) and must not be modified
+        """
+        return self.allowed_actions
+
+    def generate_actions(self) -> List[Action]:
         """
         Calculates all the legal actions with regard to the current state of the game
         """
@@ -564,3 +870,61 @@ class Kulibrat(object):
                     if self.grid[dest].player == self.turn:
                         break
         return actions
+
+    def random_playout(
+        self, rng, moves: Optional[List[Tuple[Player, int]]] = None
+    ) -> Dict[Player, int]:
+        """
+        Plays a copy of the state till the end choosing every move with
+        rng.choice(allowed_actions) and returns the final score. The moves played are
+        appended to moves (as player, move code) if provided.
+        The state is played on a compact board (see _compact_actions), several times
+        faster than executing the actions but with the same moves and results
+        """
+        cols = N_COLS
+        board = [-1] * (N_ROWS * cols)
+        positions = [[-1] * N_PAWNS, [-1] * N_PAWNS]
+        for player in (Player.BLACK, Player.RED):
+            for pawn in self.pawns[player]:
+                if pawn.position is not None:
+                    cell = pawn.position.row * cols + pawn.position.col
+                    board[cell] = player.value * N_PAWNS + pawn.number
+                    positions[player.value][pawn.number] = cell
+        score = [self.score[Player.BLACK], self.score[Player.RED]]
+        if self.winner != Player.EMPTY:
+            return {Player.BLACK: score[0], Player.RED: score[1]}
+        turn = self.turn.value
+        legal = _compact_actions(board, positions, turn)
+        while True:
+            number, row, col = rng.choice(legal)
+            mine = positions[turn]
+            source = mine[number]
+            if moves is not None:
+                moves.append(
+                    (Player(turn), (source + 1) * N_DEST_CELLS + (row + 1) * cols + col)
+                )
+            if source >= 0:
+                board[source] = -1
+            if 0 <= row < N_ROWS:
+                cell = row * cols + col
+                captured = board[cell]
+                if captured >= 0:
+                    positions[captured // N_PAWNS][captured % N_PAWNS] = -1
+                board[cell] = turn * N_PAWNS + number
+                mine[number] = cell
+            else:
+                # Goal reached, the pawn goes back to the reserve
+                mine[number] = -1
+                score[turn] += 1
+            # Same as post_turn
+            if score[turn] >= self.max_score:
+                break
+            turn = 1 - turn
+            legal = _compact_actions(board, positions, turn)
+            if not legal:
+                turn = 1 - turn
+                legal = _compact_actions(board, positions, turn)
+                if not legal:
+                    score[turn] = self.max_score
+                    break
+        return {Player.BLACK: score[0], Player.RED: score[1]}
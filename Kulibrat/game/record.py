@@ -0,0 +1,349 @@
+"""
+Compact binary game records
+
+An archive is a file header followed by a sequence of games:
+
+    archive header : b"KLBR", version, N_ROWS, N_COLS, N_PAWNS (1 byte each)
+    game header    : max_score, len(black), len(red) (little endian uint16)
+                     black and red agent descriptions (utf-8)
+    plies          : one byte per ply containing the integer move encoding
+    end of game    : END_OF_GAME byte
+
+Next to the archive an index file (archive path + ".idx") stores the offset of every
+game as a little endian uint64, so the Nth game is found with a single read.
+"""
+from __future__ import annotations
+from typing import BinaryIO, Iterator, List, Optional
+import mmap
+import os
+import struct
+
+import Kulibrat.game.game as Game
+from Kulibrat.game.game import Action, Kulibrat, Player
+
+ARCHIVE_MAGIC = b"KLBR"
+INDEX_MAGIC = b"KLBI"
+VERSION = 1
+END_OF_GAME = 0xFF
+
+ARCHIVE_HEADER = struct.Struct("<4s4B")
+INDEX_HEADER = struct.Struct("<4sB3x")
+GAME_HEADER = struct.Struct("<3H")
+OFFSET = struct.Struct("<Q")
+
+def check_board():
+    """
+    Raises ValueError if the moves of the current board do not fit in a byte
+    (see Game.configure_board)
+    """
+    if Game.N_MOVE_CODES > END_OF_GAME:
+        raise ValueError("Board too big: moves do not fit in a byte")
+
+
+def index_path(path: str) -> str:
+    return path + ".idx"
+
+
+class GameRecord:
+    """
+    A recorded game: the max score, the description of the two agents and the moves
+    """
+
+    def __init__(self, max_score: int, black: str, red: str, moves: bytes = b""):
+        self.max_score = max_score
+        self.black = black
+        self.red = red
+        self.moves = bytes(moves)
+
+    def __len__(self):
+        return len(self.moves)
+
+    def to_bytes(self) -> bytes:
+        black = self.black.encode()
+        red = self.red.encode()
+        return (
+            GAME_HEADER.pack(self.max_score, len(black), len(red))
+            + black
+            + red
+            + self.moves
+            + bytes([END_OF_GAME])
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> GameRecord:
+        """
+        Decodes a game encoded with to_bytes
+        """
+        return _read_game(data, 0)
+
+    def replay(self) -> Iterator[Kulibrat]:
+        """
+        Yields the initial state and the state after every ply.
+        The same Kulibrat object is updated and yielded every time, copy it
+        (copy_state) if it has to be kept
+        """
+        game = Kulibrat(max_score=self.max_score)
+        yield game
+        for code in self.moves:
+            game.execute_action(game.decode_action(code))
+            yield game
+
+    def state_at(self, ply: int) -> Kulibrat:
+        """
+        Returns the state after the first ply moves (0 is the initial state)
+        """
+        if not 0 <= ply <= len(self.moves):
+            raise IndexError(f"Ply {ply} out of range (0 - {len(self.moves)})")
+        game = Kulibrat(max_score=self.max_score)
+        for code in self.moves[:ply]:
+            game.execute_action(game.decode_action(code))
+        return game
+
+    def actions(self) -> List[Action]:
+        """
+        Returns the decoded actions of the game
+        """
+        game = Kulibrat(max_score=self.max_score)
+        actions = []
+        for code in self.moves:
+            action = game.decode_action(code)
+            actions.append(action)
+            game.execute_action(action)
+        return actions
+
+    @property
+    def winner(self) -> Player:
+        return self.state_at(len(self.moves)).winner
+
+    def __repr__(self):
+        return f"GameRecord({self.black} VS {self.red}, max_score={self.max_score}, plies={len(self)})"
+
+
+class GameRecordBuffer:
+    """
+    Recorder that keeps the game in memory (see Controller).
+    Useful when the game is played in another process and then written by the parent
+    """
+
+    def __init__(self):
+        self.game: Optional[GameRecord] = None
+        self._moves = bytearray()
+
+    def begin_game(self, max_score: int, black: str, red: str):
+        check_board()
+        self.game = GameRecord(max_score, black, red)
+        self._moves = bytearray()
+
+    def record(self, action: Action):
+        self._moves.append(action.encode())
+
+    def end_game(self):
+        self.game.moves = bytes(self._moves)
+
+
+class GameRecordWriter:
+    """
+    Appends games to an archive and to its index.
+    It can be passed as recorder to a Controller, moves are streamed to the file
+    while they are played
+    """
+
+    def __init__(self, path: str):
+        check_board()
+        self.path = path
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            with open(path, "wb") as f:
+                f.write(
+                    ARCHIVE_HEADER.pack(
+                        ARCHIVE_MAGIC, VERSION, Game.N_ROWS, Game.N_COLS, Game.N_PAWNS
+                    )
+                )
+            build_index(path)
+        else:
+            check_archive_header(path)
+            if not os.path.exists(index_path(path)):
+                build_index(path)
+            # Index the complete games missing from the index, then drop a game
+            # left incomplete by a crash
+            os.truncate(path, _recover_index(path))
+        self.archive: BinaryIO = open(path, "ab")
+        self.index: BinaryIO = open(index_path(path), "ab")
+        self._game_offset = 0
+
+    def begin_game(self, max_score: int, black: str, red: str):
+        self._game_offset = self.archive.tell()
+        black_ = black.encode()
+        red_ = red.encode()
+        self.archive.write(GAME_HEADER.pack(max_score, len(black_), len(red_)))
+        self.archive.write(black_)
+        self.archive.write(red_)
+
+    def record(self, action: Action):
+        self.archive.write(bytes([action.encode()]))
+
+    def end_game(self):
+        self.archive.write(bytes([END_OF_GAME]))
+        # Indexed only when complete
+        self._index_game(self._game_offset)
+
+    def write_game(self, game: GameRecord):
+        offset = self.archive.tell()
+        self.archive.write(game.to_bytes())
+        self._index_game(offset)
+
+    def _index_game(self, offset: int):
+        # The archive is flushed first, so the index never points after its end
+        self.archive.flush()
+        self.index.write(OFFSET.pack(offset))
+        self.index.flush()
+
+    def close(self):
+        # The archive is flushed first, so the index never points after its end
+        self.archive.close()
+        self.index.close()
+
+    def __enter__(self) -> GameRecordWriter:
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def check_archive_header(path: str):
+    with open(path, "rb") as f:
+        magic, version, rows, cols, pawns = ARCHIVE_HEADER.unpack(
+            f.read(ARCHIVE_HEADER.size)
+        )
+    if magic != ARCHIVE_MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a game archive")
+    if (rows, cols, pawns) != (Game.N_ROWS, Game.N_COLS, Game.N_PAWNS):
+        raise ValueError(
+            f"{path} was recorded on a {rows}x{cols} board with {pawns} pawns"
+        )
+
+
+def _read_game(buffer, offset: int) -> GameRecord:
+    max_score, black_len, red_len = GAME_HEADER.unpack_from(buffer, offset)
+    start = offset + GAME_HEADER.size
+    black = bytes(buffer[start : start + black_len]).decode()
+    start += black_len
+    red = bytes(buffer[start : start + red_len]).decode()
+    start += red_len
+    end = buffer.find(bytes([END_OF_GAME]), start)
+    if end < 0:
+        raise ValueError(f"Truncated game at offset {offset}")
+    return GameRecord(max_score, black, red, buffer[start:end])
+
+
+def _recover_index(path: str) -> int:
+    """
+    Appends to the index the complete games following the last indexed one (after
+    a crash the index can lag behind the archive) and drops a partially written
+    index entry. Returns the offset following the last complete game
+    """
+    index_file = index_path(path)
+    with open(index_file, "rb") as f:
+        index = f.read()
+    if len(index) < INDEX_HEADER.size:
+        build_index(path)
+        with open(index_file, "rb") as f:
+            index = f.read()
+    entries = (len(index) - INDEX_HEADER.size) // OFFSET.size
+    os.truncate(index_file, INDEX_HEADER.size + entries * OFFSET.size)
+    if os.path.getsize(path) <= ARCHIVE_HEADER.size:
+        return ARCHIVE_HEADER.size
+    new_offsets = []
+    with open(path, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as buffer:
+        if entries == 0:
+            offset = ARCHIVE_HEADER.size
+        else:
+            (last,) = OFFSET.unpack_from(
+                index, INDEX_HEADER.size + (entries - 1) * OFFSET.size
+            )
+            offset = last + len(_read_game(buffer, last).to_bytes())
+        while offset < len(buffer):
+            try:
+                game = _read_game(buffer, offset)
+            except (ValueError, struct.error):
+                break
+            new_offsets.append(offset)
+            offset += len(game.to_bytes())
+    with open(index_file, "ab") as f:
+        for game_offset in new_offsets:
+            f.write(OFFSET.pack(game_offset))
+    return offset
+
+
+def build_index(path: str) -> int:
+    """
+    Scans an archive and rewrites its index file. Returns the number of games.
+    A truncated game at the end of the archive (i.e. after a crash) is not indexed
+    """
+    offsets = []
+    if os.path.getsize(path) > ARCHIVE_HEADER.size:
+        check_archive_header(path)
+        with open(path, "rb") as f, mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ
+        ) as buffer:
+            offset = ARCHIVE_HEADER.size
+            while offset < len(buffer):
+                try:
+                    game = _read_game(buffer, offset)
+                except (ValueError, struct.error):
+                    break
+                offsets.append(offset)
+                offset += len(game.to_bytes())
+    with open(index_path(path), "wb") as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, VERSION))
+        for offset in offsets:
+            f.write(OFFSET.pack(offset))
+    return len(offsets)
+
+
+class GameArchive:
+    """
+    Read only, memory mapped access to an archive.
+    archive[n] returns the nth game reading only its bytes
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        check_archive_header(path)
+        if not os.path.exists(index_path(path)):
+            build_index(path)
+        self._archive_file = open(path, "rb")
+        self._index_file = open(index_path(path), "rb")
+        self.archive = mmap.mmap(self._archive_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.index = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = INDEX_HEADER.unpack_from(self.index, 0)
+        if magic != INDEX_MAGIC or version != VERSION:
+            raise ValueError(f"{index_path(path)} is not a game index")
+
+    def __len__(self):
+        return (len(self.index) - INDEX_HEADER.size) // OFFSET.size
+
+    def __getitem__(self, n: int) -> GameRecord:
+        if n < 0:
+            n += len(self)
+        if not 0 <= n < len(self):
+            raise IndexError(f"Game {n} out of range")
+        (offset,) = OFFSET.unpack_from(self.index, INDEX_HEADER.size + n * OFFSET.size)
+        return _read_game(self.archive, offset)
+
+    def __iter__(self) -> Iterator[GameRecord]:
+        for n in range(len(self)):
+            yield self[n]
+
+    def close(self):
+        self.archive.close()
+        self.index.close()
+        self._archive_file.close()
+        self._index_file.close()
+
+    def __enter__(self) -> GameArchive:
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -2,11 +2,6 @@ from Kulibrat.game.game import Kulibrat, Pawn, Player
 import Kulibrat.game.game as Game
 
 
-row_header = "   " + " {} " * Game.N_COLS
-row_separator = "  x" + "--x" * Game.N_COLS
-row_format = "{} |" + "{}|" * Game.N_COLS
-
-
 def display_pawn(pawn: Pawn) -> str:
     rep = ""
     if pawn.player == Player.EMPTY:
@@ -23,6 +18,10 @@ def display_pawn(pawn: Pawn) -> str:
 
 
 def draw_grid(game: Kulibrat):
+    # Built at every call, the board size can change (see Game.configure_board)
+    row_header = "   " + " {} " * Game.N_COLS
+    row_separator = "  x" + "--x" * Game.N_COLS
+    row_format = "{} |" + "{}|" * Game.N_COLS
     print(row_header.format(*(range(Game.N_COLS + 1))))
     print(row_separator)
     for i, row in enumerate(game.grid.rows()):
@@ -0,0 +1,38 @@
+"""
+Benchmarks of agent configurations
+"""
+from __future__ import annotations
+from typing import Dict, Iterable
+
+from Kulibrat.tournament.match import MatchResult, run_match
+from Kulibrat.tournament.spec import AgentSpec
+
+
+def strength_per_simulation(
+    candidate: AgentSpec,
+    baseline: AgentSpec,
+    budgets: Iterable[int] = (5, 15, 50),
+    games: int = 100,
+    max_score: int = 5,
+    seed: int = 0,
+    processes: int = 1,
+    verbose: bool = True,
+) -> Dict[int, MatchResult]:
+    """
+    Plays the candidate against the baseline giving both the same max_sim,
+    for every simulation budget. Returns the match results by budget
+    """
+    results = {}
+    for budget in budgets:
+        result = run_match(
+            candidate.replace(max_sim=budget),
+            baseline.replace(max_sim=budget),
+            max_games=games,
+            max_score=max_score,
+            seed=seed,
+            processes=processes,
+        )
+        results[budget] = result
+        if verbose:
+            print(f"max_sim {budget}: {result}")
+    return results
@@ -0,0 +1,264 @@
+"""
+Games played by worker processes on any host, coordinated over TCP
+
+The coordinator owns the list of jobs and listens for workers. Messages are JSON
+objects, one per line:
+
+    worker -> coordinator : {"type": "ready"}
+                            {"type": "result", "id": n, "winner": "BLACK", "record": hex}
+    coordinator -> worker : {"type": "job", "id": n, "black": spec, "red": spec,
+                             "max_score": m, "seed": s, "record": bool}
+                            {"type": "done"}
+
+A job assigned to a worker that disconnects (or that exceeds job_timeout) goes back
+to the queue; a slow worker stays connected and its late result is accepted.
+Every game depends only on its seed, so the results do not depend on which worker
+played it and match a single process run.
+"""
+from __future__ import annotations
+from collections import deque
+from multiprocessing import Process
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import json
+import socket
+import socketserver
+import threading
+
+from Kulibrat.game.game import Player
+from Kulibrat.game.record import GameRecord, GameRecordBuffer, GameRecordWriter
+from Kulibrat.tournament.runner import GameJob, play_game
+from Kulibrat.tournament.spec import AgentSpec
+
+DONE = -1
+
+
+class _WorkerHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        coordinator: Coordinator = self.server.coordinator
+        self.request.settimeout(coordinator.job_timeout)
+        job = None
+        timed_out = False
+        try:
+            for line in self._lines():
+                if line is None:
+                    # Slow worker: its job goes back to the queue, but the connection
+                    # is kept and its result is still accepted
+                    if job is not None and not timed_out:
+                        coordinator.fail(job)
+                        timed_out = True
+                    continue
+                message = json.loads(line)
+                if message["type"] == "result" and message["id"] == job:
+                    record = message.get("record")
+                    coordinator.complete(
+                        job,
+                        Player[message["winner"]],
+                        GameRecord.from_bytes(bytes.fromhex(record)) if record else None,
+                    )
+                job = coordinator.next_job()
+                timed_out = False
+                if job == DONE:
+                    self._send({"type": "done"})
+                    break
+                self._send(coordinator.job_message(job))
+        except (OSError, ValueError, KeyError):
+            # Dead or misbehaving worker
+            pass
+        finally:
+            if job is not None and job != DONE:
+                coordinator.fail(job)
+
+    def _lines(self) -> Iterator[Optional[bytes]]:
+        """
+        Yields the lines received from the worker, None when job_timeout expires.
+        Reads the socket directly: a file object is not usable after a timeout
+        """
+        buffer = b""
+        while True:
+            newline = buffer.find(b"\n")
+            if newline >= 0:
+                line, buffer = buffer[:newline], buffer[newline + 1 :]
+                yield line
+                continue
+            try:
+                data = self.request.recv(1 << 16)
+            except socket.timeout:
+                yield None
+                continue
+            if not data:
+                return
+            buffer += data
+
+    def _send(self, message: Dict):
+        self.wfile.write((json.dumps(message) + "\n").encode())
+        self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class Coordinator:
+    """
+    Serves the jobs to the workers and collects the results.
+    The agent factories of the jobs must be AgentSpec, they are sent as text
+    """
+
+    def __init__(
+        self,
+        jobs: Iterable[GameJob],
+        host: str = "127.0.0.1",
+        port: int = 0,
+        job_timeout: Optional[float] = None,
+        record: bool = False,
+    ):
+        self.jobs: List[GameJob] = list(jobs)
+        for black, red, _, _ in self.jobs:
+            if not isinstance(black, AgentSpec) or not isinstance(red, AgentSpec):
+                raise TypeError("Distributed games need AgentSpec agents")
+        self.job_timeout = job_timeout
+        self.record = record
+        self.pending = deque(range(len(self.jobs)))
+        self.results: Dict[int, Tuple[Player, Optional[GameRecord]]] = {}
+        self.condition = threading.Condition()
+        self.server = _Server((host, port), _WorkerHandler)
+        self.server.coordinator = self
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self.server.server_address[:2]
+
+    def start(self):
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def job_message(self, job: int) -> Dict:
+        black, red, max_score, seed = self.jobs[job]
+        return {
+            "type": "job",
+            "id": job,
+            "black": str(black),
+            "red": str(red),
+            "max_score": max_score,
+            "seed": seed,
+            "record": self.record,
+        }
+
+    def next_job(self) -> int:
+        """
+        Returns the next job to assign, waiting while the queue is empty but some
+        assigned jobs could still fail. Returns DONE when all the jobs are completed
+        """
+        with self.condition:
+            while True:
+                while self.pending:
+                    job = self.pending.popleft()
+                    # A job requeued after a timeout could have been completed late
+                    if job not in self.results:
+                        return job
+                if len(self.results) >= len(self.jobs):
+                    return DONE
+                self.condition.wait()
+
+    def complete(self, job: int, winner: Player, record: Optional[GameRecord]):
+        with self.condition:
+            self.results.setdefault(job, (winner, record))
+            self.condition.notify_all()
+
+    def fail(self, job: int):
+        with self.condition:
+            if job not in self.results and job not in self.pending:
+                self.pending.appendleft(job)
+            self.condition.notify_all()
+
+    def ordered_results(self) -> Iterator[Tuple[Player, Optional[GameRecord]]]:
+        """
+        Yields the results in the order of the jobs, as soon as they are available
+        """
+        for job in range(len(self.jobs)):
+            with self.condition:
+                while job not in self.results:
+                    self.condition.wait()
+                yield self.results[job]
+
+
+def run_worker(host: str, port: int) -> int:
+    """
+    Plays the jobs of a coordinator until it has no more jobs.
+    Returns the number of games played
+    """
+    played = 0
+    with socket.create_connection((host, port)) as connection:
+        stream = connection.makefile("rw")
+        stream.write(json.dumps({"type": "ready"}) + "\n")
+        stream.flush()
+        for line in stream:
+            message = json.loads(line)
+            if message["type"] == "done":
+                break
+            buffer = GameRecordBuffer() if message["record"] else None
+            winner = play_game(
+                AgentSpec.parse(message["black"]),
+                AgentSpec.parse(message["red"]),
+                message["max_score"],
+                message["seed"],
+                recorder=buffer,
+            )
+            stream.write(
+                json.dumps(
+                    {
+                        "type": "result",
+                        "id": message["id"],
+                        "winner": winner.name,
+                        "record": buffer.game.to_bytes().hex() if buffer else None,
+                    }
+                )
+                + "\n"
+            )
+            stream.flush()
+            played += 1
+    return played
+
+
+def run_games_distributed(
+    jobs: Iterable[GameJob],
+    host: str = "127.0.0.1",
+    port: int = 0,
+    local_workers: int = 0,
+    writer: Optional[GameRecordWriter] = None,
+    job_timeout: Optional[float] = None,
+    verbose: bool = False,
+) -> Iterator[Player]:
+    """
+    Same as run_games, but the games are played by workers connecting to host:port
+    (see run_worker). local_workers worker processes are started on this machine,
+    with none the coordinator waits for remote workers (printing its address
+    if verbose)
+    """
+    coordinator = Coordinator(jobs, host, port, job_timeout, record=writer is not None)
+    coordinator.start()
+    host, port = coordinator.address
+    if verbose and local_workers == 0:
+        print(f"Waiting for workers on {host}:{port}")
+    workers = [
+        Process(target=run_worker, args=(host, port), daemon=True)
+        for _ in range(local_workers)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        for winner, game in coordinator.ordered_results():
+            if writer is not None:
+                writer.write_game(game)
+            yield winner
+    finally:
+        coordinator.close()
+        for worker in workers:
+            worker.join(timeout=1)
+            if worker.is_alive():
+                worker.terminate()
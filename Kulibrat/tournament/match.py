@@ -0,0 +1,199 @@
+"""
+Matches with statistical early stopping and round robin leagues
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional, Tuple
+import itertools
+import json
+import os
+
+from Kulibrat.game.game import Player
+from Kulibrat.game.record import GameRecordWriter
+from Kulibrat.tournament.rating import SPRT, bradley_terry, elo_interval
+from Kulibrat.tournament.runner import AgentFactory, derive_seed, run_games
+
+
+class MatchResult:
+    """
+    Results of a match from the point of view of the first agent
+    """
+
+    def __init__(self, wins: int, losses: int, sprt: Optional[SPRT] = None):
+        self.wins = wins
+        self.losses = losses
+        self.sprt = sprt
+
+    @property
+    def games(self) -> int:
+        return self.wins + self.losses
+
+    @property
+    def status(self) -> Optional[str]:
+        return self.sprt.status if self.sprt is not None else None
+
+    def elo(self, confidence: float = 0.95) -> Tuple[float, float, float]:
+        return elo_interval(self.wins, self.losses, confidence)
+
+    def __str__(self):
+        elo, low, high = self.elo()
+        res = (
+            f"Games {self.games}: W {self.wins} - L {self.losses}, "
+            f"Elo {elo:+.1f} (95% CI {low:+.1f}, {high:+.1f})"
+        )
+        if self.sprt is not None:
+            res += f"\n{self.sprt}"
+        return res
+
+
+def match_jobs(
+    agent1: AgentFactory, agent2: AgentFactory, games: int, max_score: int, seed: int
+):
+    """
+    Jobs of a match, colors alternate every game so that a match stopped at
+    any point is (almost) balanced. Even games have agent1 as black
+    """
+    for i in range(games):
+        if i % 2 == 0:
+            yield agent1, agent2, max_score, derive_seed(seed, i)
+        else:
+            yield agent2, agent1, max_score, derive_seed(seed, i)
+
+
+def run_match(
+    agent1: AgentFactory,
+    agent2: AgentFactory,
+    max_games: int = 1000,
+    max_score: int = 5,
+    seed: int = 0,
+    processes: int = 1,
+    sprt: Optional[SPRT] = None,
+    writer: Optional[GameRecordWriter] = None,
+    verbose: bool = False,
+) -> MatchResult:
+    """
+    Plays up to max_games games between the two agents, stopping as soon as the
+    SPRT (if provided) accepts one of the hypotheses on the Elo of agent1.
+    Results are consumed in game order, so the stopping point and the result
+    do not depend on the number of processes
+    """
+    wins = losses = 0
+    games = run_games(
+        match_jobs(agent1, agent2, max_games, max_score, seed), processes, writer
+    )
+    try:
+        for i, winner in enumerate(games):
+            agent1_color = Player.BLACK if i % 2 == 0 else Player.RED
+            won = winner == agent1_color
+            if won:
+                wins += 1
+            else:
+                losses += 1
+            if verbose:
+                print(f"Match {i}: agent 1 {'WINS' if won else 'LOSES'} ({wins}-{losses})")
+            if sprt is not None and sprt.update(won) is not None:
+                break
+    finally:
+        games.close()
+    return MatchResult(wins, losses, sprt)
+
+
+class League:
+    """
+    Round robin league between agent configurations.
+    The pairwise results are stored in a JSON table, so a league can be extended
+    with new configurations or more games without replaying the previous ones.
+    Agents are identified by their name (str of the factory, i.e. an AgentSpec)
+    """
+
+    def __init__(self, table_path: Optional[str] = None):
+        self.table_path = table_path
+        self.players: List[str] = []
+        self.wins: Dict[Tuple[str, str], int] = {}
+        if table_path is not None and os.path.exists(table_path):
+            with open(table_path) as f:
+                table = json.load(f)
+            for player in table["players"]:
+                self.add_player(player)
+            for winner, loser, n in table["results"]:
+                self.wins[winner, loser] = n
+
+    def add_player(self, name: str):
+        if name not in self.players:
+            self.players.append(name)
+
+    def games(self, a: str, b: str) -> int:
+        return self.wins.get((a, b), 0) + self.wins.get((b, a), 0)
+
+    def record(self, a: str, b: str, result: MatchResult):
+        self.add_player(a)
+        self.add_player(b)
+        self.wins[a, b] = self.wins.get((a, b), 0) + result.wins
+        self.wins[b, a] = self.wins.get((b, a), 0) + result.losses
+
+    def save(self):
+        if self.table_path is None:
+            return
+        table = {
+            "players": self.players,
+            "results": [[a, b, n] for (a, b), n in sorted(self.wins.items())],
+        }
+        tmp_path = self.table_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(table, f, indent=1)
+        os.replace(tmp_path, self.table_path)
+
+    def ratings(self) -> Dict[str, float]:
+        return bradley_terry(self.players, self.wins)
+
+    def play(
+        self,
+        agents: List[AgentFactory],
+        games_per_pair: int = 100,
+        max_score: int = 5,
+        seed: int = 0,
+        processes: int = 1,
+        elo_margin: Optional[float] = 50,
+        verbose: bool = True,
+    ):
+        """
+        Plays every pair of agents until it has games_per_pair games in the table
+        or until an SPRT of -elo_margin against +elo_margin decides which one is
+        stronger (None disables early stopping). The table is saved after every pair
+        """
+        for agent in agents:
+            self.add_player(str(agent))
+        for agent1, agent2 in itertools.combinations(agents, 2):
+            a, b = str(agent1), str(agent2)
+            missing = games_per_pair - self.games(a, b)
+            if missing <= 0:
+                continue
+            sprt = SPRT(-elo_margin, elo_margin) if elo_margin is not None else None
+            # Previous games are replayed in the SPRT, new games get new seeds
+            if sprt is not None:
+                for _ in range(self.wins.get((a, b), 0)):
+                    sprt.update(True)
+                for _ in range(self.wins.get((b, a), 0)):
+                    sprt.update(False)
+                if sprt.status is not None:
+                    continue
+            result = run_match(
+                agent1,
+                agent2,
+                max_games=missing,
+                max_score=max_score,
+                seed=derive_seed(seed, a, b, self.games(a, b)),
+                processes=processes,
+                sprt=sprt,
+            )
+            self.record(a, b, result)
+            self.save()
+            if verbose:
+                print(f"{a} VS {b}: {result}")
+
+    def table(self) -> str:
+        ratings = self.ratings()
+        lines = [f"{'#':>3} {'Elo':>7} {'Games':>6}  Agent"]
+        for i, player in enumerate(sorted(self.players, key=lambda p: -ratings[p])):
+            games = sum(self.games(player, other) for other in self.players)
+            lines.append(f"{i + 1:>3} {ratings[player]:>+7.1f} {games:>6}  {player}")
+        return "\n".join(lines)
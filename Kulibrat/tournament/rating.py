@@ -0,0 +1,137 @@
+"""
+Elo ratings, confidence intervals and sequential probability ratio test (SPRT)
+
+Kulibrat games always have a winner, so a match is a sequence of Bernoulli trials
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional, Tuple
+from statistics import NormalDist
+import math
+
+H0 = "H0"
+H1 = "H1"
+
+
+def expected_score(elo: float) -> float:
+    """
+    Expected score of a player rated elo points more than the opponent
+    """
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def elo_from_score(score: float) -> float:
+    """
+    Elo difference corresponding to an expected score (clamped away from 0 and 1)
+    """
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+def elo_interval(
+    wins: int, losses: int, confidence: float = 0.95
+) -> Tuple[float, float, float]:
+    """
+    Returns the Elo difference estimated from the results and its confidence
+    interval (Wilson score interval, meaningful also for few games or when one
+    player won them all) as (elo, low, high)
+    """
+    games = wins + losses
+    if games == 0:
+        return 0.0, -math.inf, math.inf
+    score = wins / games
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    center = (score + z * z / (2 * games)) / (1 + z * z / games)
+    margin = (
+        z
+        / (1 + z * z / games)
+        * math.sqrt(score * (1 - score) / games + z * z / (4 * games * games))
+    )
+    return (
+        elo_from_score(score),
+        elo_from_score(center - margin),
+        elo_from_score(center + margin),
+    )
+
+
+class SPRT:
+    """
+    Sequential probability ratio test of H0: elo = elo0 against H1: elo = elo1.
+    Feed the results with update(), the test is decided when status is H0 or H1
+    """
+
+    def __init__(
+        self,
+        elo0: float = 0,
+        elo1: float = 50,
+        alpha: float = 0.05,
+        beta: float = 0.05,
+    ):
+        if elo0 >= elo1:
+            raise ValueError("elo0 must be lower than elo1")
+        self.elo0 = elo0
+        self.elo1 = elo1
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+        p0 = expected_score(elo0)
+        p1 = expected_score(elo1)
+        self._win_llr = math.log(p1 / p0)
+        self._loss_llr = math.log((1 - p1) / (1 - p0))
+        self.llr = 0.0
+        self.wins = 0
+        self.losses = 0
+
+    def update(self, win: bool) -> Optional[str]:
+        if win:
+            self.wins += 1
+            self.llr += self._win_llr
+        else:
+            self.losses += 1
+            self.llr += self._loss_llr
+        return self.status
+
+    @property
+    def status(self) -> Optional[str]:
+        if self.llr >= self.upper:
+            return H1
+        if self.llr <= self.lower:
+            return H0
+        return None
+
+    def __str__(self):
+        return (
+            f"SPRT elo0={self.elo0} elo1={self.elo1} LLR={self.llr:.2f} "
+            f"[{self.lower:.2f}, {self.upper:.2f}] {self.status or 'running'}"
+        )
+
+
+def bradley_terry(
+    players: List[str], wins: Dict[Tuple[str, str], int], iterations: int = 1000
+) -> Dict[str, float]:
+    """
+    Maximum likelihood Elo ratings of a set of players given the number of wins of
+    every ordered pair (wins[a, b] = games won by a against b).
+    Ratings are centered on 0. Players without wins or losses are kept finite
+    adding a virtual draw against the average player
+    """
+    strength = {p: 1.0 for p in players}
+    for _ in range(iterations):
+        new = {}
+        for p in players:
+            won = 0.5
+            denominator = 1 / (strength[p] + 1)
+            for q in players:
+                if p == q:
+                    continue
+                games = wins.get((p, q), 0) + wins.get((q, p), 0)
+                if games:
+                    won += wins.get((p, q), 0)
+                    denominator += games / (strength[p] + strength[q])
+            new[p] = won / denominator
+        # Normalize on the geometric mean
+        mean = math.exp(sum(math.log(s) for s in new.values()) / len(new))
+        new = {p: s / mean for p, s in new.items()}
+        converged = all(abs(new[p] - strength[p]) < 1e-9 for p in players)
+        strength = new
+        if converged:
+            break
+    return {p: 400 * math.log10(s) for p, s in strength.items()}
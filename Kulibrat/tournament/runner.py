@@ -0,0 +1,112 @@
+from __future__ import annotations
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+from functools import partial
+from multiprocessing import Pool
+import hashlib
+import random
+
+from Kulibrat.game.agent import Agent
+from Kulibrat.game.controller import Controller
+from Kulibrat.game.game import Kulibrat, Player
+from Kulibrat.game.record import GameRecord, GameRecordBuffer, GameRecordWriter
+from Kulibrat.tournament.spec import AgentSpec
+
+# An agent factory is called as factory(game, player, rng=rng) and returns a new Agent.
+# Factories must be picklable (classes, functools.partial, module level functions)
+# when the games are played in a process pool
+AgentFactory = Callable[..., Agent]
+
+# (black factory, red factory, max_score, seed)
+GameJob = Tuple[AgentFactory, AgentFactory, int, Optional[int]]
+
+
+def derive_seed(master_seed: int, *keys) -> int:
+    """
+    Derives a 64 bit seed from a master seed and a sequence of keys
+    (i.e. the game number and the color of the agent).
+    The result depends only on the arguments, not on the process or on the order
+    in which the seeds are requested, hence it is safe to use across a process pool
+    """
+    path = ":".join(str(key) for key in (master_seed,) + keys)
+    return int.from_bytes(hashlib.sha256(path.encode()).digest()[:8], "little")
+
+
+def game_rngs(seed: Optional[int]) -> Tuple[random.Random, random.Random]:
+    """
+    Returns the random streams of the black and of the red agent of a game
+    """
+    if seed is None:
+        return random.Random(), random.Random()
+    return (
+        random.Random(derive_seed(seed, Player.BLACK.name)),
+        random.Random(derive_seed(seed, Player.RED.name)),
+    )
+
+
+def describe(factory: AgentFactory, agent: Agent) -> str:
+    """
+    Description of the agent in the game records: the spec text of AgentSpec
+    factories, which tells their configurations apart, str(agent) otherwise
+    """
+    return str(factory) if isinstance(factory, AgentSpec) else str(agent)
+
+
+def play_game(
+    black: AgentFactory,
+    red: AgentFactory,
+    max_score: int = 5,
+    seed: Optional[int] = None,
+    verbose: bool = False,
+    recorder=None,
+) -> Player:
+    """
+    Plays a single game between two new agents and returns the winner.
+    Two games with the same agents and the same seed are identical.
+    The moves are streamed to the recorder if provided (see Kulibrat.game.record)
+    """
+    game = Kulibrat(max_score=max_score)
+    black_rng, red_rng = game_rngs(seed)
+    black_agent = black(game, Player.BLACK, rng=black_rng)
+    red_agent = red(game, Player.RED, rng=red_rng)
+    controller = Controller(
+        game,
+        black_agent,
+        red_agent,
+        recorder=recorder,
+        descriptions=(describe(black, black_agent), describe(red, red_agent)),
+    )
+    return controller.play(verbose=verbose)
+
+
+def _play_job(job: GameJob, record: bool = False) -> Tuple[Player, Optional[GameRecord]]:
+    black, red, max_score, seed = job
+    buffer = GameRecordBuffer() if record else None
+    winner = play_game(black, red, max_score, seed, recorder=buffer)
+    return winner, buffer.game if record else None
+
+
+def run_games(
+    jobs: Iterable[GameJob],
+    processes: int = 1,
+    writer: Optional[GameRecordWriter] = None,
+) -> Iterator[Player]:
+    """
+    Plays the games described by the jobs and yields the winners in the same order
+    of the jobs. With processes > 1 the games are distributed over a process pool,
+    every game depends only on its own seed so the results do not change.
+    If a writer is provided the games are appended to its archive in the same order
+    """
+    play = partial(_play_job, record=writer is not None)
+    if processes <= 1:
+        results = map(play, jobs)
+    else:
+        pool = Pool(processes)
+        results = pool.imap(play, jobs)
+    try:
+        for winner, game in results:
+            if writer is not None:
+                writer.write_game(game)
+            yield winner
+    finally:
+        if processes > 1:
+            pool.terminate()
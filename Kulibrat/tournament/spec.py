@@ -0,0 +1,109 @@
+from __future__ import annotations
+from typing import Dict, Optional
+import random
+
+from Kulibrat.agent.mcts import MCTSAgent, PowerScore, linear_score
+from Kulibrat.agent.random_agent import RandomAgent
+from Kulibrat.game.agent import Agent
+from Kulibrat.game.game import Kulibrat, Player
+
+AGENTS = {"mcts": MCTSAgent, "random": RandomAgent}
+
+
+def parse_score_f(value: str):
+    """
+    "linear" -> linear_score, "pow:B" -> PowerScore(B)
+    """
+    if value == "linear":
+        return linear_score
+    if value.startswith("pow:"):
+        return PowerScore(float(value[len("pow:") :]))
+    raise ValueError(f"Unknown score function {value}")
+
+
+def format_score_f(score_f) -> str:
+    if score_f is linear_score:
+        return "linear"
+    if isinstance(score_f, PowerScore):
+        # repr, so the text form gives back exactly the same base
+        return f"pow:{float(score_f.base)!r}"
+    raise ValueError(f"Score function {score_f} has no text representation")
+
+
+def parse_value(key: str, value: str):
+    if key == "score_f":
+        return parse_score_f(value)
+    if value in ("true", "false"):
+        return value == "true"
+    for type_ in (int, float):
+        try:
+            return type_(value)
+        except ValueError:
+            pass
+    return value
+
+
+def format_value(key: str, value) -> str:
+    if key == "score_f":
+        return format_score_f(value)
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+class AgentSpec:
+    """
+    A picklable description of an agent configuration, usable as agent factory
+    (spec(game, player, rng=rng) builds a new agent).
+    The text form is kind:key=value,key=value, i.e.
+        random
+        mcts:c=1,max_sim=15,score_f=pow:2
+    """
+
+    def __init__(self, kind: str, **params):
+        if kind not in AGENTS:
+            raise ValueError(f"Unknown agent {kind}, known agents: {list(AGENTS)}")
+        self.kind = kind
+        self.params: Dict = params
+
+    @classmethod
+    def parse(cls, text: str) -> AgentSpec:
+        kind, _, params = text.strip().partition(":")
+        values = {}
+        for item in filter(None, params.split(",")):
+            key, sep, value = item.partition("=")
+            if not sep:
+                raise ValueError(f"Invalid agent parameter {item} in {text}")
+            values[key.strip()] = parse_value(key.strip(), value.strip())
+        return cls(kind, **values)
+
+    def replace(self, **params) -> AgentSpec:
+        """
+        Returns a copy of the spec with some parameters changed
+        """
+        return AgentSpec(self.kind, **{**self.params, **params})
+
+    def __call__(
+        self, game: Kulibrat, player: Player, rng: Optional[random.Random] = None
+    ) -> Agent:
+        return AGENTS[self.kind](game, player, rng=rng, **self.params)
+
+    def __str__(self):
+        if not self.params:
+            return self.kind
+        params = ",".join(
+            f"{key}={format_value(key, value)}"
+            for key, value in sorted(self.params.items())
+        )
+        return f"{self.kind}:{params}"
+
+    def __repr__(self):
+        return f"AgentSpec({str(self)})"
+
+    def __eq__(self, other):
+        return isinstance(other, AgentSpec) and str(self) == str(other)
+
+    def __hash__(self):
+        return hash(str(self))
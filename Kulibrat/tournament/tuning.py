@@ -0,0 +1,269 @@
+"""
+Hyperparameter tuning of MCTSAgent
+
+Candidates are evaluated with matches against a reference agent. Every completed
+evaluation is appended to a JSON lines cache, so an interrupted sweep resumes from
+where it stopped. The strength of each candidate is paired with its move latency
+to pick the best configuration for a given time budget.
+"""
+from __future__ import annotations
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import itertools
+import json
+import math
+import os
+import random
+import time
+
+from Kulibrat.game.game import Kulibrat, Player
+from Kulibrat.tournament.match import match_jobs
+from Kulibrat.tournament.rating import elo_from_score, elo_interval
+from Kulibrat.tournament.runner import derive_seed, run_games
+from Kulibrat.tournament.spec import AgentSpec, parse_score_f
+
+
+class ResultCache:
+    """
+    Append only JSON lines file of evaluations, indexed by their key
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Line truncated by an interruption
+                        continue
+                    self.entries[entry["key"]] = entry
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def __getitem__(self, key: str) -> Dict:
+        return self.entries[key]
+
+    def add(self, key: str, **values):
+        entry = {"key": key, **values}
+        self.entries[key] = entry
+        if self.path is not None:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+
+
+class TuningResult:
+    def __init__(self, spec: AgentSpec, wins: int, losses: int, latency: float):
+        self.spec = spec
+        self.wins = wins
+        self.losses = losses
+        self.latency = latency
+
+    @property
+    def elo(self) -> float:
+        """
+        Elo difference against the reference agent
+        """
+        return elo_interval(self.wins, self.losses)[0]
+
+    def __str__(self):
+        return (
+            f"{self.spec}: Elo {self.elo:+.1f} ({self.wins}-{self.losses}), "
+            f"{self.latency * 1000:.1f} ms/move"
+        )
+
+
+def measure_latency(
+    spec: AgentSpec, max_score: int = 5, samples: int = 8, seed: int = 0
+) -> float:
+    """
+    Mean time spent by the agent choosing a move, measured on the positions of a
+    random game
+    """
+    rng = random.Random(derive_seed(seed, "latency"))
+    game = Kulibrat(max_score=max_score)
+    elapsed = 0.0
+    measured = 0
+    while measured < samples and not game.check_game_over():
+        agent = spec(game, game.turn, rng=random.Random(rng.getrandbits(64)))
+        start = time.perf_counter()
+        agent.choose_move(game.allowed_actions, [])
+        elapsed += time.perf_counter() - start
+        measured += 1
+        game.execute_action(rng.choice(game.allowed_actions))
+    return elapsed / max(measured, 1)
+
+
+def grid(space: Dict[str, Sequence]) -> List[Dict]:
+    """
+    All the combinations of the parameter values, i.e.
+    grid({"c": [0.5, 1], "max_sim": [15, 30]}) has 4 elements
+    """
+    keys = list(space)
+    return [dict(zip(keys, values)) for values in itertools.product(*space.values())]
+
+
+def _parse_params(params: Dict) -> Dict:
+    # score_f could be given as text (see AgentSpec)
+    if isinstance(params.get("score_f"), str):
+        return {**params, "score_f": parse_score_f(params["score_f"])}
+    return params
+
+
+def evaluate(
+    candidates: Iterable[AgentSpec],
+    reference: AgentSpec,
+    games: int = 100,
+    max_score: int = 5,
+    seed: int = 0,
+    processes: int = 1,
+    cache: Optional[ResultCache] = None,
+    verbose: bool = True,
+) -> List[TuningResult]:
+    """
+    Plays games games of every candidate against the reference.
+    Move latencies are measured before any game is played.
+    The games of all the candidates not yet in the cache are played in a single
+    stream, so every process stays busy until the end of the sweep
+    """
+    cache = cache if cache is not None else ResultCache()
+    candidates = list(candidates)
+
+    def key(spec: AgentSpec) -> str:
+        return f"{spec}|{reference}|{max_score}|{games}|{seed}"
+
+    missing = [spec for spec in candidates if key(spec) not in cache]
+    # Measured before starting the games, with processes > 1 the pool would load
+    # the CPU while measuring
+    latencies = [measure_latency(spec, max_score, seed=seed) for spec in missing]
+    jobs = itertools.chain.from_iterable(
+        match_jobs(spec, reference, games, max_score, derive_seed(seed, str(spec)))
+        for spec in missing
+    )
+    wins = 0
+    for i, winner in enumerate(run_games(jobs, processes)):
+        spec = missing[i // games]
+        # Even games have the candidate as black (see match_jobs)
+        candidate_color = Player.BLACK if (i % games) % 2 == 0 else Player.RED
+        wins += winner == candidate_color
+        if i % games == games - 1:
+            latency = latencies[i // games]
+            cache.add(key(spec), wins=wins, losses=games - wins, latency=latency)
+            if verbose:
+                print(TuningResult(spec, wins, games - wins, latency))
+            wins = 0
+    return [
+        TuningResult(
+            spec,
+            cache[key(spec)]["wins"],
+            cache[key(spec)]["losses"],
+            cache[key(spec)]["latency"],
+        )
+        for spec in candidates
+    ]
+
+
+def grid_search(
+    space: Dict[str, Sequence],
+    reference: AgentSpec,
+    base: AgentSpec = AgentSpec("mcts"),
+    **kwargs,
+) -> List[TuningResult]:
+    """
+    Evaluates every combination of the parameter space applied to the base spec.
+    Accepts the same keyword arguments of evaluate
+    """
+    candidates = [base.replace(**_parse_params(params)) for params in grid(space)]
+    return evaluate(candidates, reference, **kwargs)
+
+
+def spsa(
+    start: Dict[str, float],
+    steps: Dict[str, float],
+    iterations: int = 50,
+    games: int = 20,
+    base: AgentSpec = AgentSpec("mcts"),
+    bounds: Optional[Dict[str, Tuple[float, float]]] = None,
+    learning_rate: float = 1.0,
+    max_score: int = 5,
+    seed: int = 0,
+    processes: int = 1,
+    cache: Optional[ResultCache] = None,
+    verbose: bool = True,
+) -> Dict[str, float]:
+    """
+    Simultaneous perturbation stochastic approximation over numeric parameters
+    (c, max_sim, score_depth, score_base). Every iteration plays the perturbed
+    configurations theta + delta and theta - delta against each other.
+    Perturbations are drawn from a seeded stream and the matches are cached,
+    so an interrupted run replays the completed iterations from the cache
+    """
+    bounds = bounds or {}
+    rng = random.Random(derive_seed(seed, "spsa"))
+    theta = dict(start)
+    for k in range(iterations):
+        # Standard SPSA gain sequences
+        a_k = learning_rate / (k + 1) ** 0.602
+        c_k = 1 / (k + 1) ** 0.101
+        delta = {p: rng.choice((-1, 1)) for p in theta}
+        plus = {p: theta[p] + c_k * steps[p] * delta[p] for p in theta}
+        minus = {p: theta[p] - c_k * steps[p] * delta[p] for p in theta}
+        result = evaluate(
+            [spec_from_params(base, plus, bounds)],
+            spec_from_params(base, minus, bounds),
+            games=games,
+            max_score=max_score,
+            seed=derive_seed(seed, k),
+            processes=processes,
+            cache=cache,
+            verbose=False,
+        )[0]
+        # Elo of theta + delta against theta - delta, scaled to [-1, 1]
+        gradient = elo_from_score((result.wins + 0.5) / (games + 1)) / 400
+        for p in theta:
+            theta[p] += a_k * steps[p] * gradient * delta[p]
+            low, high = bounds.get(p, (-math.inf, math.inf))
+            theta[p] = min(max(theta[p], low), high)
+        if verbose:
+            print(f"Iteration {k}: {spec_from_params(base, theta, bounds)}")
+    return theta
+
+
+def spec_from_params(
+    base: AgentSpec,
+    params: Dict[str, float],
+    bounds: Optional[Dict[str, Tuple[float, float]]] = None,
+) -> AgentSpec:
+    """
+    Builds the spec of a point of the SPSA space. Integer parameters are rounded,
+    score_base b is turned in score_f = PowerScore(b)
+    """
+    bounds = bounds or {}
+    values = {}
+    for p, value in params.items():
+        low, high = bounds.get(p, (-math.inf, math.inf))
+        value = min(max(value, low), high)
+        if p in ("max_sim", "score_depth"):
+            values[p] = max(1, round(value))
+        elif p == "score_base":
+            values["score_f"] = parse_score_f(f"pow:{value:.3g}")
+        else:
+            values[p] = round(value, 3)
+    return base.replace(**values)
+
+
+def best_per_budget(
+    results: Iterable[TuningResult], budgets: Iterable[float]
+) -> Dict[float, Optional[TuningResult]]:
+    """
+    For every time budget (seconds per move) returns the strongest configuration
+    whose latency fits in it (None if no configuration fits)
+    """
+    results = list(results)
+    best = {}
+    for budget in sorted(budgets):
+        fitting = [r for r in results if r.latency <= budget]
+        best[budget] = max(fitting, key=lambda r: r.elo, default=None)
+    return best
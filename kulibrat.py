@@ -1,35 +1,89 @@
-from numpy import result_type
-from Kulibrat.agent.random_agent import RandomAgent
-from Kulibrat.agent.mcts import MCTSAgent
-from typing import Container
-from Kulibrat.game.game import Kulibrat, Player
-from Kulibrat.game.controller import Controller
-from Kulibrat.agent.human_agent import HumanAgent
+"""
+Kulibrat command line. Without arguments it starts the interactive menu,
+run python3 kulibrat.py --help for the non interactive commands.
+Agents are given as specs (see Kulibrat.tournament.spec), i.e. random or
+mcts:c=1,max_sim=15,score_f=pow:2; play also accepts human.
+Modules are imported by the commands using them, so short commands start fast
+"""
+from functools import partial
+import argparse
 import sys
 
 
 def setup_game(black, red, max_score):
+    from Kulibrat.game.controller import Controller
+    from Kulibrat.game.game import Kulibrat
+
     game = Kulibrat(max_score=max_score)
     controller = Controller(game, black, red)
     return controller.play()
 
 
-def simulate(agent1, agent2, n=100, max_score=5):
+def simulate(
+    agent1,
+    agent2,
+    n=100,
+    max_score=5,
+    seed=None,
+    processes=1,
+    record_path=None,
+    address=None,
+    local_workers=0,
+    lockstep=0,
+):
+    """
+    Plays n games between two agent factories, exchanging colors after n // 2 games.
+    Factories are called as factory(game, color, rng=rng).
+    With a seed every game gets its own random streams derived from it, so the results
+    are the same when the games are played in a pool of processes > 1.
+    If record_path is provided the games are appended to that game archive.
+    With an address (host, port) or local_workers > 0 the games are played by
+    distributed workers (see Kulibrat.tournament.distributed), the agents must be
+    AgentSpec.
+    With lockstep > 0 up to lockstep games are played together in this process
+    (see Kulibrat.agent.lockstep)
+    """
+    from Kulibrat.game.game import Player
+    from Kulibrat.game.record import GameRecordWriter
+    from Kulibrat.tournament.runner import derive_seed, run_games
+
+    half = n // 2
+    jobs = [
+        (agent1, agent2, max_score, None if seed is None else derive_seed(seed, i))
+        for i in range(half)
+    ] + [
+        (agent2, agent1, max_score, None if seed is None else derive_seed(seed, i))
+        for i in range(half, 2 * half)
+    ]
     first_res = {Player.BLACK: 0, Player.RED: 0}
     second_res = {Player.BLACK: 0, Player.RED: 0}
-    for i in range(n // 2):
-        print(f"Match {i}")
-        game = Kulibrat(max_score=max_score)
-        first_res[
-            setup_game(agent1(game, Player.BLACK), agent2(game, Player.RED), max_score)
-        ] += 1
-    print("Exchanging Colors!")
-    for i in range(n // 2):
-        print(f"Match {i}")
-        game = Kulibrat(max_score=max_score)
-        second_res[
-            setup_game(agent2(game, Player.BLACK), agent1(game, Player.RED), max_score)
-        ] += 1
+    writer = GameRecordWriter(record_path) if record_path is not None else None
+    if address is not None or local_workers > 0:
+        host, port = address if address is not None else ("127.0.0.1", 0)
+        from Kulibrat.tournament.distributed import run_games_distributed
+
+        games = run_games_distributed(
+            jobs, host, port, local_workers, writer, verbose=True
+        )
+    elif lockstep > 0:
+        from Kulibrat.agent.lockstep import run_lockstep
+
+        games = run_lockstep(jobs, lockstep, writer=writer)
+    else:
+        games = run_games(jobs, processes, writer)
+    try:
+        for i, winner in enumerate(games):
+            if i == half:
+                print("Exchanging Colors!")
+            print(f"Match {i % half}")
+            print(f"Player {winner.name} Won!")
+            if i < half:
+                first_res[winner] += 1
+            else:
+                second_res[winner] += 1
+    finally:
+        if writer is not None:
+            writer.close()
     tot_res = {
         "Agent 1": first_res[Player.BLACK] + second_res[Player.RED],
         "Agent 2": first_res[Player.RED] + second_res[Player.BLACK],
@@ -45,6 +99,10 @@ def simulate(agent1, agent2, n=100, max_score=5):
 
 
 def setup_human(opponent, human_red=False, max_score=5):
+    from Kulibrat.agent.human_agent import HumanAgent
+    from Kulibrat.game.controller import Controller
+    from Kulibrat.game.game import Kulibrat, Player
+
     game = Kulibrat(max_score=max_score)
     if human_red:
         human = HumanAgent(game, Player.RED)
@@ -58,6 +116,10 @@ def setup_human(opponent, human_red=False, max_score=5):
 
 
 def menu():
+    from Kulibrat.agent.human_agent import HumanAgent
+    from Kulibrat.agent.mcts import MCTSAgent, PowerScore, linear_score
+    from Kulibrat.agent.random_agent import RandomAgent
+
     print("Select type of match")
     print("1 - Human VS Human")
     print("2 - Human VS Random")
@@ -97,16 +159,15 @@ def menu():
         n_sim = int(input("Number of games to play: "))
         simulate(
             # Change this parameters for customizing agent 1
-            agent1=lambda game, color: MCTSAgent(
-                game, color, c=1, max_sim=15, score_f=lambda x: 2 ** x  # 10 **x
+            agent1=partial(
+                MCTSAgent, c=1, max_sim=15, score_f=PowerScore(2)  # PowerScore(10)
             ),
             # Change this parameters for customizing agent 2
-            agent2=lambda game, color: MCTSAgent(
-                game,
-                color,
+            agent2=partial(
+                MCTSAgent,
                 c=1,
                 max_sim=15,
-                score_f=lambda x: x,  # x
+                score_f=linear_score,  # x
             ),
             n=n_sim,
             max_score=max_score,
@@ -114,10 +175,8 @@ def menu():
     elif choice == 5:
         n_sim = int(input("Number of games to play: "))
         simulate(
-            agent1=lambda game, color: MCTSAgent(
-                game, color, c=1, max_sim=15, score_f=lambda x: 2 ** x
-            ),
-            agent2=lambda game, c: RandomAgent(game, c),
+            agent1=partial(MCTSAgent, c=1, max_sim=15, score_f=PowerScore(2)),
+            agent2=RandomAgent,
             n=n_sim,
             max_score=max_score,
         )
@@ -125,6 +184,234 @@ def menu():
         print("Choice not valid")
 
 
+def make_agent(text):
+    """
+    Agent factory of a spec given on the command line
+    """
+    if text == "human":
+        from Kulibrat.agent.human_agent import HumanAgent
+
+        return lambda game, player, rng=None: HumanAgent(game, player)
+    from Kulibrat.tournament.spec import AgentSpec
+
+    return AgentSpec.parse(text)
+
+
+def address(text):
+    host, _, port = text.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def play_command(args):
+    from Kulibrat.tournament.runner import play_game
+
+    winner = play_game(
+        make_agent(args.black),
+        make_agent(args.red),
+        args.max_score,
+        args.seed,
+    )
+    print(f"Player {winner.name} Won!")
+
+
+def match_command(args):
+    simulate(
+        make_agent(args.agent1),
+        make_agent(args.agent2),
+        n=args.games,
+        max_score=args.max_score,
+        seed=args.seed,
+        processes=args.processes,
+        record_path=args.record,
+        address=args.address,
+        local_workers=args.local_workers,
+        lockstep=args.lockstep,
+    )
+
+
+def tournament_command(args):
+    from Kulibrat.tournament.match import League
+
+    league = League(args.table)
+    league.play(
+        [make_agent(agent) for agent in args.agents],
+        games_per_pair=args.games,
+        max_score=args.max_score,
+        seed=args.seed,
+        processes=args.processes,
+        elo_margin=args.elo_margin if args.elo_margin > 0 else None,
+    )
+    print(league.table())
+
+
+def bench_command(args):
+    from Kulibrat.tournament.bench import strength_per_simulation
+
+    strength_per_simulation(
+        make_agent(args.candidate),
+        make_agent(args.baseline),
+        budgets=[int(b) for b in args.budgets.split(",")],
+        games=args.games,
+        max_score=args.max_score,
+        seed=args.seed,
+        processes=args.processes,
+    )
+
+
+def perft_command(args):
+    from Kulibrat.analysis.perft import run
+
+    run(args)
+
+
+def statespace_command(args):
+    from Kulibrat.analysis.statespace import explore
+
+    try:
+        space = explore(
+            max_score=args.max_score,
+            config=(args.rows, args.cols, args.pawns),
+            max_depth=args.max_depth,
+            processes=args.processes,
+            spill_dir=args.spill_dir,
+        )
+    except ValueError as error:
+        args.error(str(error))
+    print(space.report())
+
+
+def analyze_command(args):
+    from Kulibrat.analysis.positions import AnalysisCache, analyze
+
+    def positions(lines):
+        # A packed state or the comma separated move codes from the initial position
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if "," in line:
+                yield [int(code) for code in filter(None, line.split(","))]
+            else:
+                yield int(line)
+
+    cache = AnalysisCache(args.cache) if args.cache else None
+    source = open(args.positions) if args.positions != "-" else sys.stdin
+    try:
+        for result in analyze(
+            positions(source),
+            engine=args.engine,
+            budget=args.budget,
+            max_score=args.max_score,
+            seed=args.seed,
+            processes=args.processes,
+            cache=cache,
+        ):
+            print(result.to_json())
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if cache is not None:
+            cache.close()
+
+
+def worker_command(args):
+    from Kulibrat.tournament.distributed import run_worker
+
+    print(f"Played {run_worker(*args.address)} games")
+
+
+def parser():
+    parser = argparse.ArgumentParser(
+        description="Kulibrat, without a command starts the interactive menu"
+    )
+    commands = parser.add_subparsers(dest="command")
+
+    def command(name, function, help, seed=True, processes=True):
+        sub = commands.add_parser(name, help=help)
+        sub.set_defaults(function=function)
+        sub.add_argument("--max-score", type=int, default=5)
+        if seed:
+            sub.add_argument("--seed", type=int, default=None)
+        if processes:
+            sub.add_argument("--processes", type=int, default=1)
+        return sub
+
+    play = command("play", play_command, "play a game", processes=False)
+    play.add_argument("black")
+    play.add_argument("red")
+
+    match = command("match", match_command, "play games between two agents")
+    match.add_argument("agent1")
+    match.add_argument("agent2")
+    match.add_argument("--games", type=int, default=100)
+    match.add_argument("--record", help="game archive the games are appended to")
+    match.add_argument(
+        "--address", type=address, help="host:port of the coordinator of the workers"
+    )
+    match.add_argument("--local-workers", type=int, default=0)
+    match.add_argument(
+        "--lockstep", type=int, default=0, help="games searched together in lockstep"
+    )
+
+    tournament = command("tournament", tournament_command, "round robin league")
+    tournament.add_argument("agents", nargs="+")
+    tournament.add_argument("--games", type=int, default=100, help="games per pair")
+    tournament.add_argument("--table", help="JSON file of the league table")
+    tournament.add_argument(
+        "--elo-margin", type=float, default=50, help="SPRT margin, 0 disables it"
+    )
+    tournament.set_defaults(seed=0)
+
+    bench = command("bench", bench_command, "strength per simulation budget")
+    bench.add_argument("candidate")
+    bench.add_argument("baseline")
+    bench.add_argument("--budgets", default="5,15,50")
+    bench.add_argument("--games", type=int, default=100)
+    bench.set_defaults(seed=0)
+
+    # The perft module imports only the game, it does not slow down the start
+    from Kulibrat.analysis.perft import add_arguments
+
+    perft = commands.add_parser("perft", help="count the reachable positions")
+    perft.set_defaults(function=perft_command)
+    add_arguments(perft)
+
+    statespace = command(
+        "statespace", statespace_command, "enumerate the reachable states", seed=False
+    )
+    statespace.add_argument("--rows", type=int, default=4)
+    statespace.add_argument("--cols", type=int, default=3)
+    statespace.add_argument("--pawns", type=int, default=4)
+    statespace.add_argument("--max-depth", type=int)
+    statespace.add_argument(
+        "--spill-dir", help="directory for the visited set and the large layers"
+    )
+    statespace.set_defaults(error=statespace.error)
+
+    analyze = command("analyze", analyze_command, "analyze positions")
+    analyze.add_argument(
+        "positions",
+        help="file (- for stdin) with a packed state or comma separated move codes "
+        "(i.e. 3, for a single move) per line",
+    )
+    analyze.add_argument("--engine", default="mcts:max_sim=100")
+    analyze.add_argument("--budget", type=int, help="simulations per position")
+    analyze.add_argument("--cache", help="SQLite analysis cache")
+    analyze.set_defaults(seed=0)
+
+    worker = commands.add_parser("worker", help="play the games of a coordinator")
+    worker.set_defaults(function=worker_command)
+    worker.add_argument("address", type=address, help="host:port of the coordinator")
+    return parser
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    if args.command is None:
+        while True:
+            menu()
+    args.function(args)
+
+
 if __name__ == "__main__":
-    while True:
-        menu()
+    main()